@@ -4,10 +4,14 @@ import logging
 from web3 import Web3, HTTPProvider
 
 from monitoring_service import MonitoringService
-from monitoring_service.transport import MatrixTransport
+from monitoring_service.transport import MatrixTransport, LocalTransport, DecoderPool
+from monitoring_service.transport.local import parse_address
 from monitoring_service.state_db import StateDB
 from monitoring_service.api.rest import ServiceApi
 from monitoring_service.blockchain import BlockchainMonitor
+from monitoring_service.batching_provider import BatchingHTTPProvider
+from monitoring_service.constants import DEFAULT_SETTLE_TIMEOUT
+from monitoring_service.rpc_metrics import rpc_metrics_middleware
 from raiden_libs.no_ssl_patch import no_ssl_verification
 
 
@@ -31,15 +35,19 @@ from raiden_libs.no_ssl_patch import no_ssl_verification
 @click.option(
     '--matrix-username',
     default=None,
-    required=True,
     help='Matrix username'
 )
 @click.option(
     '--matrix-password',
     default=None,
-    required=True,
     help='Matrix password'
 )
+@click.option(
+    '--local-transport',
+    default=None,
+    type=str,
+    help='receive messages on unix:PATH or HOST:PORT instead of Matrix'
+)
 @click.option(
     '--rest-host',
     default='localhost',
@@ -52,47 +60,108 @@ from raiden_libs.no_ssl_patch import no_ssl_verification
     type=int,
     help='REST service endpoint'
 )
+@click.option(
+    '--decode-workers',
+    default=0,
+    type=int,
+    help='verify message signatures in this many processes (0: on the event loop)'
+)
 @click.option(
     '--eth-rpc',
     default='http://localhost:8545',
     type=str,
     help='Ethereum node RPC URI'
 )
+@click.option(
+    '--eth-rpc-batch-window',
+    default=0,
+    type=float,
+    help='collect concurrent RPC calls for this long (s) and send them as one batch '
+         '(0: off, e.g. 0.005 to enable)'
+)
+@click.option(
+    '--confirmations',
+    default=5,
+    type=int,
+    help='number of blocks after which events are considered final'
+)
+@click.option(
+    '--settle-timeout',
+    default=DEFAULT_SETTLE_TIMEOUT,
+    type=int,
+    help='settlement timeout (in blocks) of monitored channels'
+)
 @click.option(
     '--state-db',
     default=os.path.join(click.get_app_dir('raiden-monitoring-service'), 'state.db'),
     type=str,
     help='state DB to save received balance proofs to'
 )
+@click.option(
+    '--state-db-synchronous',
+    default='NORMAL',
+    type=click.Choice(['OFF', 'NORMAL', 'FULL', 'EXTRA']),
+    help='sqlite synchronous level of the state DB'
+)
+@click.option(
+    '--state-db-threads',
+    default=0,
+    type=int,
+    help='run state DB queries in a thread pool with this many readers (0: on the event loop)'
+)
 def main(
     private_key,
     monitoring_channel,
     matrix_homeserver,
     matrix_username,
     matrix_password,
+    local_transport,
     rest_host,
     rest_port,
+    decode_workers,
     eth_rpc,
-    state_db
+    eth_rpc_batch_window,
+    confirmations,
+    settle_timeout,
+    state_db,
+    state_db_synchronous,
+    state_db_threads
 ):
     app_dir = click.get_app_dir('raiden-monitoring-service')
     if os.path.isdir(app_dir) is False:
         os.makedirs(app_dir)
-    transport = MatrixTransport(
-        matrix_homeserver,
-        matrix_username,
-        matrix_password,
-        monitoring_channel
+    db = StateDB(
+        state_db,
+        synchronous=state_db_synchronous,
+        read_threads=state_db_threads
     )
-    web3 = Web3(HTTPProvider(eth_rpc))
-    blockchain = BlockchainMonitor(web3)
-    db = StateDB(state_db)
+    if local_transport is not None:
+        transport = LocalTransport(parse_address(local_transport))
+    elif matrix_username is None or matrix_password is None:
+        raise click.UsageError('--matrix-username and --matrix-password are required')
+    else:
+        transport = MatrixTransport(
+            matrix_homeserver,
+            matrix_username,
+            matrix_password,
+            monitoring_channel,
+            state_db=db
+        )
+    if decode_workers > 0:
+        transport.use_decoder_pool(DecoderPool(decode_workers))
+    if eth_rpc_batch_window > 0:
+        web3 = Web3(BatchingHTTPProvider(eth_rpc, batch_window=eth_rpc_batch_window))
+    else:
+        web3 = Web3(HTTPProvider(eth_rpc))
+    web3.middleware_stack.add(rpc_metrics_middleware)
+    blockchain = BlockchainMonitor(web3, state_db=db, confirmations=confirmations)
 
     monitor = MonitoringService(
         private_key,
         state_db=db,
         transport=transport,
-        blockchain=blockchain
+        blockchain=blockchain,
+        settle_timeout=settle_timeout
     )
 
     api = ServiceApi(monitor, blockchain)
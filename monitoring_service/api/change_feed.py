@@ -0,0 +1,92 @@
+import gevent.event
+
+# seconds between comments keeping an idle event stream open
+KEEPALIVE_INTERVAL = 15
+
+
+def format_version(epoch: str, seq: int) -> str:
+    return '%s-%d' % (epoch, seq)
+
+
+def parse_version(value: str):
+    """(epoch, sequence number) of a state version, see `format_version`.
+    Raises ValueError if `value` is not one"""
+    epoch, _, seq = value.rpartition('-')
+    if epoch == '' or not seq.isdigit():
+        raise ValueError('invalid state version %r' % value)
+    return epoch, int(seq)
+
+
+class ChangeFeed:
+    """Balance proof changes of a `StateDB` after a state version, see
+    `StateDB.changes_since`.
+
+    A state version is `EPOCH-SEQ`: the `StateDB.epoch` and a sequence number. Sequence
+    numbers start over when the service restarts, so versions of another epoch are
+    treated like changes that are no longer known.
+
+    A change is encoded as `{"version": V, "channel_id": C, "balance_proof": ...}`,
+    with the current balance proof of the channel from the `ResponseCache`, or null if
+    it was deleted. Several changes of a channel are reported as its last one.
+    """
+    def __init__(self, state_db, response_cache) -> None:
+        self.state_db = state_db
+        self.response_cache = response_cache
+        # set and replaced on every change, waking up all streams
+        self.changed = gevent.event.Event()
+        state_db.add_change_listener(self.on_change)
+
+    def on_change(self, channel_id) -> None:
+        changed, self.changed = self.changed, gevent.event.Event()
+        changed.set()
+
+    @property
+    def version(self) -> str:
+        """Current state version"""
+        return format_version(self.state_db.epoch, self.state_db.version)
+
+    def changes_since(self, since: str) -> list:
+        epoch, seq = parse_version(since)
+        if epoch != self.state_db.epoch:
+            return None
+        return self.state_db.changes_since(seq)
+
+    def encode_change(self, seq: int, channel_id: int) -> bytes:
+        balance_proof = self.response_cache.get_entry(channel_id)
+        return b'{"version":"%s","channel_id":%d,"balance_proof":%s}' % (
+            format_version(self.state_db.epoch, seq).encode(),
+            channel_id,
+            b'null' if balance_proof is None else balance_proof
+        )
+
+    def get_changes(self, since: str) -> bytes:
+        """JSON object with the changes after version `since` and the current version,
+        None if they are not available"""
+        changes = self.changes_since(since)
+        if changes is None:
+            return None
+        return b'{"version":"%s","changes":[%s]}' % (
+            self.version.encode(),
+            b','.join(self.encode_change(*x) for x in changes)
+        )
+
+    def stream(self, since: str):
+        """Server-sent events of the changes after version `since`, then of new changes
+        as they happen. Each event's id is its state version. A `reset` event ends the
+        stream if changes were missed or the service restarted; the client has to
+        download the full state again"""
+        while True:
+            # wait for the next change before reading, so none is missed
+            changed = self.changed
+            changes = self.changes_since(since)
+            if changes is None:
+                yield b'event: reset\ndata: %s\n\n' % self.version.encode()
+                return
+            for seq, channel_id in changes:
+                since = format_version(self.state_db.epoch, seq)
+                yield b'id: %s\ndata: %s\n\n' % (
+                    since.encode(),
+                    self.encode_change(seq, channel_id)
+                )
+            if changed.wait(KEEPALIVE_INTERVAL) is False:
+                yield b': keepalive\n\n'
@@ -0,0 +1,56 @@
+import json
+
+
+def encode_json(value) -> bytes:
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+class ResponseCache:
+    """JSON encoded balance proofs of a `StateDB`, ready to be sent.
+
+    Each balance proof is encoded once and kept until it is stored again or deleted,
+    which the state DB reports through its change listener. Lists are joined from the
+    encoded entries, and the list of all balance proofs is kept until the next change,
+    so serving unchanged data does no JSON encoding at all.
+    """
+    def __init__(self, state_db) -> None:
+        self.state_db = state_db
+        # channel id -> encoded balance proof
+        self.entries: dict = {}
+        self.full_list = None
+        self.hits = 0
+        self.misses = 0
+        state_db.add_change_listener(self.on_change)
+
+    def on_change(self, channel_id) -> None:
+        self.full_list = None
+        if channel_id is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(channel_id, None)
+
+    def get_entry(self, channel_id: int) -> bytes:
+        """Encoded balance proof of a channel, None if there is none"""
+        data = self.entries.get(channel_id, None)
+        if data is not None:
+            self.hits += 1
+            return data
+        balance_proof = self.state_db.get_balance_proof(channel_id)
+        if balance_proof is None:
+            return None
+        self.misses += 1
+        data = self.entries[channel_id] = encode_json(balance_proof)
+        return data
+
+    def encode_list(self, balance_proofs: list) -> bytes:
+        """JSON array of stored balance proofs"""
+        return b'[' + b','.join(self.get_entry(x['channel_id']) for x in balance_proofs) + b']'
+
+    def get_full_list(self) -> bytes:
+        """JSON array of all stored balance proofs, ordered by channel id"""
+        if self.full_list is None:
+            self.full_list = self.encode_list(self.state_db.query_balance_proofs())
+        return self.full_list
+
+    def get_count(self) -> bytes:
+        return encode_json({'count': len(self.state_db.balance_proofs)})
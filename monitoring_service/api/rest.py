@@ -1,21 +1,270 @@
-from flask import Flask, request
-from flask_restful import Api, Resource
+from flask import Flask, Response, request
+from flask_restful import Api, Resource, abort
 from gevent.pywsgi import WSGIServer
 import gevent
+from eth_utils import is_address, to_checksum_address
+from raiden_libs.messages import BalanceProof
 from monitoring_service.blockchain import BlockchainMonitor
 from monitoring_service import MonitoringService
+from monitoring_service.transport.decoder import json_loads, decode_messages_on_hub
+from monitoring_service.api.response_cache import ResponseCache
+from monitoring_service.api.change_feed import ChangeFeed, format_version, parse_version
+from monitoring_service.metrics import REGISTRY
 
 API_PATH = '/api/1'
+METRICS_PATH = '/metrics'
+# largest page of GET /balance_proofs
+MAX_PAGE_SIZE = 1000
+# balance proofs accepted in one POST request
+MAX_BATCH_SIZE = 10000
+# events accepted in one PUT request
+MAX_EVENT_BATCH_SIZE = 100000
+# seconds a POST request waits for its balance proofs to be validated, by default and
+# at most. The HTTP greenlet is held up meanwhile.
+DEFAULT_BATCH_WAIT = 1
+MAX_BATCH_WAIT = 30
 
 
-class BalanceProofResource(Resource):
-    def __init__(self, monitor=None):
+def parse_batch(data: bytes, mimetype: str) -> list:
+    """Split a request body into raw messages: a JSON array or JSON lines.
+    Items of an array are returned parsed, lines as strings"""
+    if mimetype == 'application/x-ndjson':
+        return [x for x in data.decode().splitlines() if x.strip() != '']
+    try:
+        batch = json_loads(data)
+    except ValueError:
+        abort(400, message='request body is not valid JSON')
+    if not isinstance(batch, list):
+        abort(400, message='expected a JSON array')
+    return batch
+
+
+def parse_event(data):
+    """Event of a batch, None if it is not one"""
+    if isinstance(data, str):
+        try:
+            data = json_loads(data)
+        except ValueError:
+            return None
+    if not isinstance(data, dict) or 'event' not in data or 'transactionHash' not in data:
+        return None
+    return data
+
+
+def parse_arg(name: str, parse, description: str):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        abort(400, message='%s must be %s' % (name, description))
+
+
+def int_arg(name: str):
+    return parse_arg(name, int, 'an integer')
+
+
+def float_arg(name: str):
+    return parse_arg(name, float, 'a number')
+
+
+def checksum_address(value: str) -> str:
+    if not is_address(value):
+        raise ValueError('not an address: %s' % value)
+    return to_checksum_address(value)
+
+
+def address_arg(name: str):
+    """Address in any spelling, as the checksum address balance proofs are stored with"""
+    return parse_arg(name, checksum_address, 'an address')
+
+
+def cached_response(resource, build) -> Response:
+    """JSON response of `build()`, or 304 if the client has the current state.
+    The ETag is the state version, so it changes with every stored or deleted proof
+    and does not repeat after a restart. The version is also sent in `X-State-Version`,
+    to follow `/changes` from"""
+    state_db = resource.monitor.state_db
+    version = format_version(state_db.epoch, state_db.version)
+    if request.if_none_match.contains(version):
+        response = Response(status=304)
+    else:
+        response = Response(build(), mimetype='application/json')
+    response.set_etag(version)
+    response.headers['X-State-Version'] = version
+    return response
+
+
+def task_status(result) -> dict:
+    """Outcome of a balance proof submitted to `MonitoringService.on_balance_proof`"""
+    if result.ready() is False:
+        return {'status': 'pending'}
+    if result.successful() is False:
+        return {'status': 'error'}
+    task = result.get()
+    if task is None:
+        return {'status': 'superseded'}
+    if task.successful() is False:
+        return {'status': 'error'}
+    if task.value is True:
+        return {'status': 'stored'}
+    return {'status': 'rejected', 'check': task.failed_check}
+
+
+class CachedResource(Resource):
+    def __init__(self, monitor=None, response_cache=None):
         super().__init__()
         assert isinstance(monitor, MonitoringService)
+        assert isinstance(response_cache, ResponseCache)
         self.monitor = monitor
+        self.response_cache = response_cache
+
+
+class BalanceProofResource(CachedResource):
+    def get(self):
+        """Stored balance proofs ordered by channel id, all of them by default.
+        Query parameters:
+            limit: return a page of at most this many balance proofs. If there may
+                be more, the `X-Next-Cursor` header is set to the cursor of the next page
+            cursor: return balance proofs after this one
+            participant, contract_address, from_timestamp, to_timestamp: filters.
+                Addresses may be given in any spelling, not only checksummed
+        The ETag changes whenever a balance proof is stored or deleted, so polls with
+        If-None-Match get a 304 without the balance proofs being looked at."""
+        if len(request.args) == 0:
+            return cached_response(self, self.response_cache.get_full_list)
+        limit = int_arg('limit')
+        if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+            abort(400, message='limit must be between 1 and %d' % MAX_PAGE_SIZE)
+        next_cursor = None
+
+        def build():
+            nonlocal next_cursor
+            page = self.query(limit)
+            if limit is not None and len(page) == limit:
+                next_cursor = str(page[-1]['channel_id'])
+            return self.response_cache.encode_list(page)
+
+        response = cached_response(self, build)
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    def query(self, limit):
+        return self.monitor.state_db.query_balance_proofs(
+            after=int_arg('cursor'),
+            limit=limit,
+            participant=address_arg('participant'),
+            contract_address=address_arg('contract_address'),
+            min_timestamp=int_arg('from_timestamp'),
+            max_timestamp=int_arg('to_timestamp')
+        )
+
+    def post(self):
+        """Submit a batch of signed balance proofs, as a JSON array or as JSON lines
+        (Content-Type: application/x-ndjson). They are validated like those received
+        over the transport. Returns the outcome of each, in order.
+        Query parameters:
+            wait: seconds to wait for the balance proofs to be validated, up to
+                MAX_BATCH_WAIT. Those still being validated are reported as pending"""
+        wait = float_arg('wait')
+        if wait is None:
+            wait = DEFAULT_BATCH_WAIT
+        if not 0 <= wait <= MAX_BATCH_WAIT:
+            abort(400, message='wait must be between 0 and %d' % MAX_BATCH_WAIT)
+        batch = parse_batch(request.get_data(), request.mimetype)
+        if len(batch) > MAX_BATCH_SIZE:
+            abort(413, message='at most %d balance proofs per request' % MAX_BATCH_SIZE)
+        message_types = [BalanceProof.__name__]
+        batch_decoder = self.monitor.transport.batch_decoder
+        if batch_decoder is not None:
+            messages = batch_decoder.pool.decode(batch, message_types)
+        else:
+            messages = decode_messages_on_hub(batch, message_types)
+        results = [
+            self.monitor.on_balance_proof(x) if isinstance(x, BalanceProof) else None
+            for x in messages
+        ]
+        gevent.wait([x for x in results if x is not None], timeout=wait)
+        return [
+            {'status': 'invalid'} if x is None else task_status(x)
+            for x in results
+        ]
+
+
+class BalanceProofEntryResource(CachedResource):
+    def get(self, channel_id):
+        """Stored balance proof of a channel"""
+        data = self.response_cache.get_entry(channel_id) if channel_id > 0 else None
+        if data is None:
+            abort(404, message='no balance proof for channel %d' % channel_id)
+        return cached_response(self, lambda: data)
+
+
+class BalanceProofCountResource(CachedResource):
+    def get(self):
+        """Number of stored balance proofs"""
+        return cached_response(self, self.response_cache.get_count)
+
+
+class ChangesResource(Resource):
+    def __init__(self, change_feed=None):
+        super().__init__()
+        assert isinstance(change_feed, ChangeFeed)
+        self.change_feed = change_feed
+
+    def since_arg(self) -> str:
+        since = request.args.get('since', None)
+        if since is None:
+            abort(400, message='since is required')
+        try:
+            parse_version(since)
+        except ValueError:
+            abort(400, message='since must be a state version, see X-State-Version')
+        return since
+
+    def get(self):
+        """Balance proofs stored or deleted after state version `since`.
+        410 if these changes are not known any more, e.g. after a restart"""
+        data = self.change_feed.get_changes(self.since_arg())
+        if data is None:
+            abort(410, message='changes are not available, download the balance proofs')
+        return Response(data, mimetype='application/json')
+
+
+class ChangeStreamResource(ChangesResource):
+    def since_arg(self) -> str:
+        # reconnecting event sources continue after the last event they received
+        last_event_id = request.headers.get('Last-Event-ID', None)
+        if last_event_id is not None:
+            try:
+                parse_version(last_event_id)
+                return last_event_id
+            except ValueError:
+                pass
+        return super().since_arg()
 
     def get(self):
-        return list(self.monitor.balance_proofs.values())
+        """The changes after `since` as server-sent events, followed by new ones"""
+        return Response(
+            self.change_feed.stream(self.since_arg()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache'}
+        )
+
+
+class MetricsResource(Resource):
+    def __init__(self, registry=REGISTRY):
+        super().__init__()
+        self.registry = registry
+
+    def get(self):
+        """All metrics in the Prometheus text format"""
+        return Response(
+            self.registry.exposition(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
 
 
 class BlockchainEvents(Resource):
@@ -25,8 +274,27 @@ class BlockchainEvents(Resource):
         self.blockchain = blockchain
 
     def put(self):
-        json_data = request.get_json()
-        self.blockchain.handle_event(json_data)
+        """Dispatch an event, or a batch of them as a JSON array or JSON lines
+        (Content-Type: application/x-ndjson). For a batch, returns the outcome of each
+        event in order, see `BlockchainMonitor.submit_events`, or 'invalid'"""
+        if request.mimetype == 'application/x-ndjson':
+            batch = parse_batch(request.get_data(), request.mimetype)
+        else:
+            json_data = request.get_json()
+            if isinstance(json_data, dict):
+                self.blockchain.handle_event(json_data)
+                return
+            if not isinstance(json_data, list):
+                abort(400, message='expected an event or a JSON array of events')
+            batch = json_data
+        if len(batch) > MAX_EVENT_BATCH_SIZE:
+            abort(413, message='at most %d events per request' % MAX_EVENT_BATCH_SIZE)
+        events = [parse_event(x) for x in batch]
+        results = iter(self.blockchain.submit_events([x for x in events if x is not None]))
+        return [
+            {'status': 'invalid' if x is None else next(results)}
+            for x in events
+        ]
 
 
 class ServiceApi:
@@ -35,9 +303,28 @@ class ServiceApi:
         self.api = Api(self.flask_app)
         self.api.add_resource(BlockchainEvents, API_PATH + "/events",
                               resource_class_kwargs={'blockchain': blockchain})
+        self.response_cache = ResponseCache(monitor.state_db)
+        cached_resource_kwargs = {
+            'monitor': monitor,
+            'response_cache': self.response_cache
+        }
         self.api.add_resource(BalanceProofResource, API_PATH + "/balance_proofs",
-                              resource_class_kwargs={'monitor': monitor})
+                              resource_class_kwargs=cached_resource_kwargs)
+        self.api.add_resource(BalanceProofEntryResource,
+                              API_PATH + "/balance_proofs/<int:channel_id>",
+                              resource_class_kwargs=cached_resource_kwargs)
+        self.api.add_resource(BalanceProofCountResource, API_PATH + "/balance_proofs/count",
+                              resource_class_kwargs=cached_resource_kwargs)
+        self.change_feed = ChangeFeed(monitor.state_db, self.response_cache)
+        self.api.add_resource(ChangesResource, API_PATH + "/changes",
+                              resource_class_kwargs={'change_feed': self.change_feed})
+        self.api.add_resource(ChangeStreamResource, API_PATH + "/changes/stream",
+                              resource_class_kwargs={'change_feed': self.change_feed})
+        self.api.add_resource(MetricsResource, METRICS_PATH)
 
     def run(self, host, port):
         self.rest_server = WSGIServer((host, port), self.flask_app)
         self.server_greenlet = gevent.spawn(self.rest_server.serve_forever)
+
+    def stop(self):
+        self.rest_server.stop()
@@ -0,0 +1,102 @@
+import json
+import logging
+import gevent
+from gevent.event import AsyncResult
+from web3.providers.rpc import HTTPProvider
+from web3.utils.request import make_post_request
+
+log = logging.getLogger(__name__)
+
+# read-only calls that are safe to reorder and to send in one batch
+BATCHED_METHODS = (
+    'eth_getTransactionByHash',
+    'eth_getTransactionReceipt',
+    'eth_getCode',
+    'eth_getBlockByNumber',
+    'eth_getBlockByHash',
+)
+
+
+class BatchingHTTPProvider(HTTPProvider):
+    """HTTPProvider that merges concurrent requests into JSON-RPC batches.
+
+    A request for one of `batched_methods` is queued and the calling greenlet waits.
+    `batch_window` seconds after the first queued request (or as soon as
+    `max_batch_size` requests are queued) all of them are sent in one HTTP request,
+    and every caller gets the response with its own id back.
+    Other methods are sent right away, as by HTTPProvider.
+    """
+    def __init__(
+        self,
+        endpoint_uri: str,
+        batch_window: float = 0.005,
+        max_batch_size: int = 100,
+        batched_methods=BATCHED_METHODS,
+        request_kwargs=None
+    ) -> None:
+        super().__init__(endpoint_uri, request_kwargs)
+        assert batch_window >= 0
+        assert max_batch_size > 0
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batched_methods = frozenset(batched_methods)
+        self.pending: list = []
+        self.flusher = None
+        self.batch_count = 0
+
+    def make_request(self, method, params):
+        if method not in self.batched_methods:
+            return super().make_request(method, params)
+        request = {
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params or [],
+            'id': next(self.request_counter),
+        }
+        result = AsyncResult()
+        self.pending.append((request, result))
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.flusher is None:
+            self.flusher = gevent.spawn_later(self.batch_window, self.flush)
+        return result.get()
+
+    def flush(self):
+        """Send all queued requests now"""
+        flusher, self.flusher = self.flusher, None
+        if flusher is not None and flusher is not gevent.getcurrent():
+            flusher.kill(block=False)
+        batch, self.pending = self.pending, []
+        if len(batch) == 0:
+            return
+        try:
+            responses = self.send_batch([request for request, _ in batch])
+        except Exception as e:
+            [result.set_exception(e) for _, result in batch]
+            return
+        for request, result in batch:
+            response = responses.get(request['id'], None)
+            if response is None:
+                result.set_exception(
+                    ValueError('no response to %s (id %d)' % (request['method'], request['id']))
+                )
+            else:
+                result.set(response)
+
+    def send_batch(self, requests: list) -> dict:
+        """POST `requests` as one JSON-RPC batch, returns responses keyed by request id"""
+        self.batch_count += 1
+        payload = requests[0] if len(requests) == 1 else requests
+        raw_response = make_post_request(
+            self.endpoint_uri,
+            json.dumps(payload).encode(),
+            **self.get_request_kwargs()
+        )
+        responses = self.decode_rpc_response(raw_response)
+        if len(requests) == 1:
+            responses = [responses]
+        if not isinstance(responses, list):
+            # the node rejected the batch as a whole
+            raise ValueError('JSON-RPC batch failed: %s' % responses)
+        log.debug('sent JSON-RPC batch of %d requests', len(requests))
+        return {x['id']: x for x in responses}
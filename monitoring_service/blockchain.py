@@ -1,21 +1,74 @@
 import gevent
 import gevent.event
+import gevent.pool
 import logging
 import requests
+from collections import deque
+from eth_utils import encode_hex
 from monitoring_service.constants import (
     EVENT_CHANNEL_CLOSE,
     EVENT_CHANNEL_SETTLED,
     EVENT_TRANSFER_UPDATED
 )
+from monitoring_service.cache import LRUCache
+from monitoring_service.call_decoder import CallDecoder
+from monitoring_service.log_scanner import LogScanner
+from monitoring_service.metrics import Histogram
 from raiden_contracts.contract_manager import CONTRACT_MANAGER
-from raiden_libs.utils import make_filter, decode_contract_call
 
 log = logging.getLogger(__name__)
 
+EVENT_DISPATCH_LAG_BLOCKS = Histogram(
+    'monitoring_service_event_dispatch_lag_blocks',
+    'Blocks between an event and the chain head when it is dispatched',
+    ['event'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+)
+EVENT_HANDLER_SECONDS = Histogram(
+    'monitoring_service_event_handler_seconds',
+    'Time spent handling a blockchain event, including fetching its transaction',
+    ['event']
+)
+
 
 class BlockchainMonitor(gevent.Greenlet):
-    def __init__(self, web3):
+    """Dispatch TokenNetwork events to registered handlers.
+
+    Events are fetched with `LogScanner` in block ranges and dispatched once their
+    block has `confirmations` confirmations. Until then they are kept as pending.
+    Hashes of recently scanned blocks are kept in a ring buffer of `reorg_depth`
+    entries. If one of them changes, the chain was reorganized: pending events after
+    the common ancestor are dropped and the blocks are scanned again.
+
+    The confirmed (dispatched) and unconfirmed (scanned) heads are checkpointed to
+    the `syncstate` table of `state_db` (if given). A restarted monitor continues
+    after the confirmed head. Without a stored position, scanning starts at
+    `start_block`, or at the current block if that is None. Recording a block hash
+    and checkpointing costs `eth_getBlock` calls, so while catching up they are done
+    every `checkpoint_interval` scanned ranges only, and once the scan reaches the
+    head. Events dispatched since the last checkpoint are dispatched again after a
+    crash.
+
+    Decoded transactions are kept in an LRU cache of `tx_cache_size` entries, so
+    several events emitted by one transaction cost a single `eth_getTransaction`.
+    Transactions of a scanned range are fetched by up to `prefetch_concurrency`
+    greenlets at once, which lets a batching web3 provider merge the requests.
+    """
+    def __init__(
+        self,
+        web3,
+        state_db=None,
+        start_block: int = None,
+        confirmations: int = 0,
+        reorg_depth: int = 128,
+        tx_cache_size: int = 4096,
+        prefetch_concurrency: int = 50,
+        checkpoint_interval: int = 10
+    ):
         super().__init__()
+        assert confirmations >= 0
+        assert reorg_depth > 0
+        assert checkpoint_interval > 0
         self.is_running = gevent.event.Event()
         self.is_running.set()
         self.event_handlers = {
@@ -24,60 +77,216 @@ class BlockchainMonitor(gevent.Greenlet):
             EVENT_TRANSFER_UPDATED: []
         }
         self.web3 = web3
+        self.state_db = state_db
+        self.start_block = start_block
         self.poll_interval = 5
-        self.event_filters = None
+        self.log_scanner = None
+        self.confirmations = confirmations
+        self.checkpoint_interval = checkpoint_interval
+        # last scanned block
+        self.last_block = None
+        # last block whose events were dispatched
+        self.confirmed_block = None
+        self.pending_events: list = []
+        self.block_hashes: deque = deque(maxlen=reorg_depth)
+        self.call_decoder = CallDecoder(CONTRACT_MANAGER.get_contract_abi('TokenNetwork'))
+        self.decoded_transactions = LRUCache(tx_cache_size)
+        self.prefetch_pool = gevent.pool.Pool(prefetch_concurrency)
 
-    def make_filters(self):
-        ret = []
+    def make_log_scanner(self):
+        abis = []
         for event_name in self.event_handlers.keys():
             abi = CONTRACT_MANAGER.get_event_abi('TokenNetwork', event_name)
             assert abi is not None
-            ret.append(make_filter(self.web3, abi))
-        return ret
+            abis.append(abi)
+        return LogScanner(self.web3, abis)
 
     def _run(self):
         while self.is_running.is_set():
             try:
-                if self.event_filters is None:
-                    self.event_filters = self.make_filters()
                 self.poll_blockchain()
-            except requests.exceptions.ConnectionError as e:
+            except requests.exceptions.ConnectionError:
                 endpoint = self.web3.providers[0].endpoint_uri
                 log.warning(
                     'Ethereum node (%s) refused connection. Retrying in %d seconds.' %
                     (endpoint, self.poll_interval)
                 )
-                self.event_filters = None
                 gevent.sleep(self.poll_interval)
-        self.uninstall_filters()
-
-    def uninstall_filters(self):
-        if self.event_filters is None:
-            return
-        [self.web3.eth.uninstallFilter(f.filter_id)
-         for f in self.event_filters]
-        self.event_filters = None
 
     def register_handler(self, event, callback):
         self.event_handlers[event].append(callback)
 
+    def get_block_hash(self, block_number: int) -> str:
+        block = self.web3.eth.getBlock(block_number)
+        if block is None:
+            return None
+        return encode_hex(block['hash'])
+
+    def restore_sync_state(self, current_block: int):
+        head, head_hash = None, None
+        if self.state_db is not None:
+            sync_state = self.state_db.sync_state
+            head = sync_state.get('confirmed_head_number', None)
+            head_hash = sync_state.get('confirmed_head_hash', None)
+        if head is not None:
+            self.block_hashes.append((head, head_hash))
+        elif self.start_block is not None:
+            head = self.start_block - 1
+        else:
+            head = max(current_block - self.confirmations, -1)
+        self.last_block = self.confirmed_block = head
+        self.checkpoint()
+
+    def checkpoint(self):
+        """Save confirmed and unconfirmed heads to syncstate"""
+        if self.state_db is None or self.confirmed_block < 0:
+            return
+        hashes = dict(self.block_hashes)
+        confirmed_hash = hashes.get(self.confirmed_block, None)
+        if confirmed_hash is None:
+            confirmed_hash = self.get_block_hash(self.confirmed_block)
+        unconfirmed_hash = hashes.get(self.last_block, None)
+        if unconfirmed_hash is None:
+            unconfirmed_hash = self.get_block_hash(self.last_block)
+        self.state_db.update_sync_state(
+            self.confirmed_block,
+            confirmed_hash,
+            self.last_block,
+            unconfirmed_hash
+        )
+
+    def record_head(self):
+        """Record the hash of the last scanned block and checkpoint"""
+        self.block_hashes.append((self.last_block, self.get_block_hash(self.last_block)))
+        self.checkpoint()
+
+    def check_reorg(self):
+        """Compare recorded block hashes with the chain, and rewind to the newest one
+        that still matches if they differ"""
+        if len(self.block_hashes) == 0:
+            return
+        block_number, block_hash = self.block_hashes[-1]
+        if self.get_block_hash(block_number) == block_hash:
+            return
+        ancestor = None
+        while len(self.block_hashes) > 0:
+            block_number, block_hash = self.block_hashes.pop()
+            if self.get_block_hash(block_number) == block_hash:
+                self.block_hashes.append((block_number, block_hash))
+                ancestor = block_number
+                break
+        if ancestor is None:
+            # all recorded blocks were replaced, start over a full buffer length back
+            ancestor = max(block_number - self.block_hashes.maxlen, -1)
+        dropped = [ev for ev in self.pending_events if ev['blockNumber'] > ancestor]
+        self.pending_events = [ev for ev in self.pending_events if ev['blockNumber'] <= ancestor]
+        log.warning(
+            'Chain reorganization detected, rewinding to block %d. Dropped %d pending events.',
+            ancestor, len(dropped)
+        )
+        if ancestor < self.confirmed_block:
+            log.error(
+                'Reorganization is deeper than %d confirmations, '
+                'events of blocks %d-%d were already dispatched and will be dispatched again',
+                self.confirmations, ancestor + 1, self.confirmed_block
+            )
+            self.confirmed_block = ancestor
+        self.last_block = ancestor
+
+    def dispatch_confirmed(self, current_block: int):
+        """Dispatch pending events that have enough confirmations"""
+        confirmed_block = min(self.last_block, current_block - self.confirmations)
+        if confirmed_block <= self.confirmed_block:
+            return
+        ready = [ev for ev in self.pending_events if ev['blockNumber'] <= confirmed_block]
+        self.pending_events = self.pending_events[len(ready):]
+        self.prefetch_transactions(ready)
+        for ev in ready:
+            EVENT_DISPATCH_LAG_BLOCKS.observe(current_block - ev['blockNumber'], event=ev['event'])
+            self.handle_event(ev)
+        self.confirmed_block = confirmed_block
+
     def poll_blockchain(self):
-        for f in self.event_filters:
-            events = f.get_new_entries()
-            [self.handle_event(ev) for ev in events]
+        """Scan new blocks up to the current one, one range at a time, and dispatch
+        events that became confirmed"""
+        if self.log_scanner is None:
+            self.log_scanner = self.make_log_scanner()
+        current_block = self.web3.eth.blockNumber
+        if self.last_block is None:
+            self.restore_sync_state(current_block)
+        self.check_reorg()
+        scanned = 0
+        while self.last_block < current_block and self.is_running.is_set():
+            events, end = self.log_scanner.scan(self.last_block + 1, current_block)
+            self.pending_events.extend(events)
+            self.last_block = end
+            self.dispatch_confirmed(current_block)
+            scanned += 1
+            if scanned % self.checkpoint_interval == 0:
+                self.record_head()
+        if scanned % self.checkpoint_interval != 0:
+            self.record_head()
         gevent.sleep(self.poll_interval)
 
     def stop(self):
         self.is_running.clear()
 
-    def handle_event(self, event):
-        tx = self.web3.eth.getTransaction(event['transactionHash'])
-        abi = CONTRACT_MANAGER.get_contract_abi('TokenNetwork')
-        s = decode_contract_call(abi, tx['data'])
-        assert s is not None
-        handlers = self.event_handlers.get(event['event'], None)
-        log.info(event)
-        if handlers is None:
-            log.warning('unhandled event type: %s' % str(event))
+    def decode_transaction(self, tx_hash):
+        """Fetch and decode the TokenNetwork call made by a transaction"""
+        if not isinstance(tx_hash, str):
+            tx_hash = encode_hex(tx_hash)
+        decoded = self.decoded_transactions.get(tx_hash, None)
+        if decoded is None:
+            tx = self.web3.eth.getTransaction(tx_hash)
+            decoded = self.call_decoder.decode(tx['data'])
+            assert decoded is not None
+            self.decoded_transactions[tx_hash] = decoded
+        return decoded
+
+    def prefetch_transactions(self, events: list, ignore_errors: bool = False):
+        """Fetch the transactions of `events` concurrently, filling the cache.
+        With `ignore_errors`, transactions that fail are left to `handle_event`"""
+        tx_hashes = set(ev['transactionHash'] for ev in events)
+        if len(tx_hashes) < 2:
             return
-        [x(event, s) for x in handlers]
+        if ignore_errors:
+            self.prefetch_pool.map(self.try_decode_transaction, tx_hashes)
+        else:
+            self.prefetch_pool.map(self.decode_transaction, tx_hashes)
+
+    def try_decode_transaction(self, tx_hash):
+        try:
+            return self.decode_transaction(tx_hash)
+        except Exception:
+            return None
+
+    def handle_event(self, event) -> bool:
+        """Call the handlers of an event. Returns False if there are none"""
+        handlers = self.event_handlers.get(event['event'], None)
+        # injected events may have any name, keep the label values bounded
+        label = event['event'] if handlers is not None else 'unknown'
+        with EVENT_HANDLER_SECONDS.time(event=label):
+            s = self.decode_transaction(event['transactionHash'])
+            log.info('%s', event)
+            if handlers is None:
+                log.warning('unhandled event type: %s', event)
+                return False
+            [x(event, s) for x in handlers]
+            return True
+
+    def submit_events(self, events: list) -> list:
+        """Dispatch events injected from outside (e.g. replayed ones) in order, like
+        confirmed scanned events: their transactions are prefetched concurrently first.
+        Returns the outcome of each event: 'handled', 'unhandled' (no handlers for its
+        type) or 'error'"""
+        self.prefetch_transactions(events, ignore_errors=True)
+        results = []
+        for event in events:
+            try:
+                handled = self.handle_event(event)
+            except Exception:
+                log.exception('handling submitted event failed: %s', event)
+                results.append('error')
+                continue
+            results.append('handled' if handled else 'unhandled')
+        return results
@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A dict-like mapping holding at most `maxsize` entries.
+    Reads and writes mark an entry as recently used; the least recently used
+    entry is evicted when the cache is full."""
+    def __init__(self, maxsize: int = 1024) -> None:
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries expire. `set` takes the lifetime of the entry in
+    seconds, None meaning it never expires. Expired entries read as missing."""
+    def __init__(self, maxsize: int = 1024, clock=time.monotonic) -> None:
+        super().__init__(maxsize)
+        self.clock = clock
+
+    def set(self, key, value, ttl: float = None):
+        expires = None if ttl is None else self.clock() + ttl
+        super().__setitem__(key, (expires, value))
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def get(self, key, default=None):
+        entry = super().get(key, None)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires is not None and expires <= self.clock():
+            self._data.pop(key)
+            # count the lookup as a miss
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+
+class RecentSet:
+    """Set remembering at least the `maxsize` // 2 most recently added keys.
+
+    Keys are kept in two generations of plain sets. When the current generation is
+    full, it becomes the old one and the previous old one is dropped. This needs far
+    less memory per key than an ordered mapping, at the cost of forgetting keys in
+    blocks instead of one at a time."""
+    def __init__(self, maxsize: int = 100000) -> None:
+        assert maxsize > 1
+        self.generation_size = maxsize // 2
+        self.current: set = set()
+        self.old: set = set()
+
+    def add(self, key) -> bool:
+        """Add `key`, returns False if it was already present"""
+        if key in self:
+            return False
+        if len(self.current) >= self.generation_size:
+            self.old = self.current
+            self.current = set()
+        self.current.add(key)
+        return True
+
+    def __contains__(self, key):
+        return key in self.current or key in self.old
+
+    def __len__(self):
+        return len(self.current) + len(self.old)
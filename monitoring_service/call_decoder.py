@@ -0,0 +1,30 @@
+from eth_abi import decode_abi
+from eth_utils import decode_hex, function_abi_to_4byte_selector
+
+
+class CallDecoder:
+    """Decode contract calls (transaction input data) of one contract.
+
+    Equivalent to `raiden_libs.utils.decode_contract_call`, but the table mapping
+    4-byte selectors to function names and argument types is built once, instead of
+    hashing every function signature of the ABI for each decoded call.
+    """
+    def __init__(self, contract_abi: list) -> None:
+        self.functions = {}
+        for description in contract_abi:
+            if description.get('type') != 'function':
+                continue
+            selector = function_abi_to_4byte_selector(description)
+            name = description['name'].split('(')[0]
+            arg_types = [item['type'] for item in description['inputs']]
+            self.functions[selector] = (name, arg_types)
+
+    def decode(self, call_data: str):
+        """Returns a tuple (function name, decoded arguments), or None if the
+        selector is not part of the contract ABI"""
+        call_data_bin = decode_hex(call_data)
+        function = self.functions.get(call_data_bin[:4], None)
+        if function is None:
+            return None
+        name, arg_types = function
+        return name, decode_abi(arg_types, call_data_bin[4:])
@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import logging
+import gevent
+import gevent.event
+import gevent.pool
+from monitoring_service.constants import DEFAULT_SETTLE_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+
+class ChallengeScheduler(gevent.Greenlet):
+    """Run challenges of closed channels, most urgent first.
+
+    Closed channels are kept in a heap ordered by their settlement deadline
+    (close block + `settle_timeout`). Up to `workers` challenges run at once; a
+    worker that becomes free always takes the channel with the earliest deadline,
+    no matter in which order the channels were scheduled.
+
+    Parameters:
+        challenge: called with the channel id, in a worker greenlet
+        settle_timeout: settlement timeout of the monitored channels, in blocks
+        workers: maximum number of concurrent challenges
+        block_number: optional callable returning the current block number. If given,
+            channels whose deadline has already passed are dropped instead of challenged.
+    """
+    def __init__(
+        self,
+        challenge,
+        settle_timeout: int = DEFAULT_SETTLE_TIMEOUT,
+        workers: int = 10,
+        block_number=None
+    ) -> None:
+        super().__init__()
+        assert settle_timeout > 0
+        assert workers > 0
+        self.challenge = challenge
+        self.settle_timeout = settle_timeout
+        self.block_number = block_number
+        self.pool = gevent.pool.Pool(workers)
+        # heap of (deadline, sequence number, channel id)
+        self.queue: list = []
+        # channel id -> deadline of the scheduled challenge
+        self.scheduled: dict = {}
+        self.counter = itertools.count()
+        self.wakeup = gevent.event.Event()
+        self.challenged_count = 0
+        self.missed_count = 0
+
+    def schedule(self, channel_id: int, close_block: int) -> int:
+        """Schedule a challenge of a channel closed in `close_block`.
+        Returns the deadline block"""
+        assert channel_id > 0
+        deadline = close_block + self.settle_timeout
+        if self.scheduled.get(channel_id, None) == deadline:
+            return deadline
+        self.scheduled[channel_id] = deadline
+        heapq.heappush(self.queue, (deadline, next(self.counter), channel_id))
+        self.wakeup.set()
+        return deadline
+
+    def cancel(self, channel_id: int) -> None:
+        """Forget a scheduled challenge, e.g. because the channel was settled"""
+        # the heap entry is skipped when it is popped
+        self.scheduled.pop(channel_id, None)
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    def pop(self):
+        """Remove the most urgent scheduled challenge.
+        Returns a tuple (channel id, deadline), or None if nothing is scheduled"""
+        while len(self.queue) > 0:
+            deadline, _, channel_id = heapq.heappop(self.queue)
+            if self.scheduled.get(channel_id, None) == deadline:
+                del self.scheduled[channel_id]
+                return channel_id, deadline
+        return None
+
+    def _run(self):
+        while True:
+            # take the next channel only once a worker is free, so channels scheduled
+            # in the meantime are considered too
+            self.pool.wait_available()
+            entry = self.pop()
+            if entry is None:
+                self.wakeup.clear()
+                self.wakeup.wait()
+                continue
+            channel_id, deadline = entry
+            if self.block_number is not None and self.block_number() > deadline:
+                self.missed_count += 1
+                log.error('Challenge period of channel %d ended at block %d, not challenging',
+                          channel_id, deadline)
+                continue
+            self.pool.spawn(self.run_challenge, channel_id)
+
+    def run_challenge(self, channel_id: int):
+        self.challenge(channel_id)
+        self.challenged_count += 1
+
+    def join_challenges(self, timeout: float = None) -> bool:
+        """Wait until all scheduled challenges are done"""
+        with gevent.Timeout(timeout, False):
+            while len(self.scheduled) > 0 or len(self.pool) > 0:
+                gevent.sleep(0.01)
+            return True
+        return False
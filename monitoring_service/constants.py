@@ -5,3 +5,6 @@ EVENT_TRANSFER_UPDATED = 'TransferUpdated'
 
 # balance proof must not be older than this to be accepted
 MAX_BALANCE_PROOF_AGE = 60 * 60
+
+# settlement timeout (in blocks) of monitored channels
+DEFAULT_SETTLE_TIMEOUT = 40
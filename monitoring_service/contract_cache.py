@@ -0,0 +1,41 @@
+import logging
+from hexbytes import HexBytes
+from monitoring_service.cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+
+class ContractCodeCache:
+    """Remember which addresses have contract code deployed.
+
+    There are only a few TokenNetwork contracts, so looking the code up for every
+    balance proof is wasted work. An address with code keeps it, so positive results
+    are cached for `positive_ttl` seconds (None: forever). Negative results are
+    cached for `negative_ttl` seconds only, as the contract may not be deployed yet
+    or the node may still be syncing.
+    """
+    def __init__(
+        self,
+        web3,
+        positive_ttl: float = None,
+        negative_ttl: float = 60,
+        maxsize: int = 1024
+    ) -> None:
+        self.web3 = web3
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize)
+
+    def has_code(self, address: str) -> bool:
+        result = self.cache.get(address, None)
+        if result is None:
+            result = self.web3.eth.getCode(address) != HexBytes('0x')
+            ttl = self.positive_ttl if result else self.negative_ttl
+            self.cache.set(address, result, ttl)
+        return result
+
+    def warm(self, addresses) -> None:
+        """Look up `addresses` now, so the first balance proofs do not have to"""
+        for address in addresses:
+            if address is not None and self.has_code(address) is False:
+                log.warning('No contract code at %s', address)
@@ -0,0 +1,96 @@
+import time
+import logging
+from eth_utils import encode_hex, event_abi_to_log_topic
+from web3.utils.events import get_event_data
+
+log = logging.getLogger(__name__)
+
+
+class LogScanner:
+    """Fetch logs of several event types with one `eth_getLogs` call per block range.
+
+    The size of the range adapts to the node: it is halved when a response has more
+    than `target_logs` entries, takes longer than `target_latency` seconds or fails,
+    and doubled when responses are small and fast.
+
+    Parameters:
+        web3: web3 instance
+        event_abis: ABIs of the events to fetch. Their topics are OR-ed in a single filter.
+        address: optionally restrict logs to this contract address
+    """
+    def __init__(
+        self,
+        web3,
+        event_abis: list,
+        address: str = None,
+        initial_chunk: int = 100,
+        min_chunk: int = 1,
+        max_chunk: int = 10000,
+        target_logs: int = 1000,
+        target_latency: float = 2.0
+    ) -> None:
+        assert min_chunk <= initial_chunk <= max_chunk
+        self.web3 = web3
+        self.address = address
+        self.event_abis = {
+            encode_hex(event_abi_to_log_topic(abi)): abi
+            for abi in event_abis
+        }
+        self.chunk_size = initial_chunk
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.target_logs = target_logs
+        self.target_latency = target_latency
+
+    def filter_params(self, from_block: int, to_block: int) -> dict:
+        params = {
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'topics': [list(self.event_abis.keys())]
+        }
+        if self.address is not None:
+            params['address'] = self.address
+        return params
+
+    def adapt_chunk_size(self, log_count: int, elapsed: float) -> None:
+        if log_count > self.target_logs or elapsed > self.target_latency:
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+        elif log_count < self.target_logs // 4 and elapsed < self.target_latency / 4:
+            self.chunk_size = min(self.max_chunk, self.chunk_size * 2)
+
+    def get_logs(self, from_block: int, to_block: int):
+        """Fetch logs of the range. If the node rejects the request, shrink the range and
+        retry, so the returned logs may end before `to_block`.
+        Returns a tuple (raw logs, last block covered)"""
+        while True:
+            end = min(to_block, from_block + self.chunk_size - 1)
+            start_time = time.monotonic()
+            try:
+                logs = self.web3.eth.getLogs(self.filter_params(from_block, end))
+            except ValueError as e:
+                # node-side limits (too many results, timeouts) are reported as RPC errors
+                if self.chunk_size == self.min_chunk:
+                    raise
+                self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+                log.warning('eth_getLogs %d-%d failed, retrying with %d blocks: %s',
+                            from_block, end, self.chunk_size, e)
+                continue
+            self.adapt_chunk_size(len(logs), time.monotonic() - start_time)
+            return logs, end
+
+    def decode_log(self, raw_log):
+        topic = raw_log['topics'][0]
+        if not isinstance(topic, str):
+            topic = encode_hex(topic)
+        abi = self.event_abis.get(topic.lower(), None)
+        if abi is None:
+            return None
+        return get_event_data(abi, raw_log)
+
+    def scan(self, from_block: int, to_block: int):
+        """Scan one chunk starting at `from_block`, but not past `to_block`.
+        Returns a tuple (decoded events ordered as on chain, last block covered)"""
+        assert from_block <= to_block
+        logs, end = self.get_logs(from_block, to_block)
+        events = [self.decode_log(x) for x in logs]
+        return [x for x in events if x is not None], end
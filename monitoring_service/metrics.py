@@ -0,0 +1,214 @@
+"""Minimal in-process metrics: counters, gauges and histograms with labels.
+
+Recording a value is a dict update. Everything else, including calling the functions
+of function gauges, happens when the registry is exposed in the Prometheus text
+format, so metrics cost next to nothing while nobody scrapes them."""
+import bisect
+import time
+from contextlib import contextmanager
+
+# seconds, from a dict lookup to a slow RPC call
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Registry:
+    """Collection of all metrics of the process, by name"""
+    def __init__(self) -> None:
+        self.metrics: dict = {}
+
+    def register(self, metric) -> None:
+        assert metric.name not in self.metrics, 'duplicate metric %s' % metric.name
+        self.metrics[metric.name] = metric
+
+    def get(self, name: str):
+        return self.metrics.get(name, None)
+
+    def exposition(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)"""
+        lines: list = []
+        for name in sorted(self.metrics):
+            self.metrics[name].expose(lines)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values) -> str:
+    if len(names) == 0:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, escape_label_value(value)) for name, value in zip(names, values)
+    )
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        registry: Registry = REGISTRY
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # label values tuple -> value
+        self.values: dict = {}
+        if registry is not None:
+            registry.register(self)
+
+    def label_values(self, labels: dict) -> tuple:
+        assert set(labels) == set(self.labelnames), 'labels must be %s' % (self.labelnames,)
+        return tuple(str(labels[x]) for x in self.labelnames)
+
+    def samples(self):
+        """(name suffix, label names, label values, value) of all samples"""
+        values = self.values
+        if len(self.labelnames) == 0 and len(values) == 0:
+            values = {(): 0}
+        for key, value in sorted(values.items()):
+            yield '', self.labelnames, key, value
+
+    def expose(self, lines: list) -> None:
+        lines.append('# HELP %s %s' % (self.name, self.documentation.replace('\n', ' ')))
+        lines.append('# TYPE %s %s' % (self.name, self.type_name))
+        for suffix, names, values, value in self.samples():
+            lines.append('%s%s%s %s' % (
+                self.name,
+                suffix,
+                format_labels(names, values),
+                format_value(value)
+            ))
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        assert amount >= 0
+        key = self.label_values(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.label_values(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down. Instead of being set, it may read its value from
+    a function at exposition time, see `set_function`"""
+    type_name = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        registry: Registry = REGISTRY
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        # label values tuple -> function returning the value
+        self.functions: dict = {}
+
+    def set_function(self, function, **labels) -> None:
+        self.functions[self.label_values(labels)] = function
+
+    def remove_function(self, function, **labels) -> None:
+        """Stop reading the value from `function`, unless it was replaced since"""
+        key = self.label_values(labels)
+        if self.functions.get(key, None) == function:
+            del self.functions[key]
+
+    def samples(self):
+        values = dict(self.values)
+        for key, function in self.functions.items():
+            values[key] = function()
+        for key, value in sorted(values.items()):
+            yield '', self.labelnames, key, value
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self.label_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.label_values(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        key = self.label_values(labels)
+        if key in self.functions:
+            return self.functions[key]()
+        return self.values.get(key, 0)
+
+
+class HistogramValue:
+    def __init__(self, bucket_count: int) -> None:
+        # observations per bucket, the last one being +Inf
+        self.buckets = [0] * (bucket_count + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        assert list(buckets) == sorted(buckets)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.label_values(labels)
+        entry = self.values.get(key, None)
+        if entry is None:
+            entry = self.values[key] = HistogramValue(len(self.buckets))
+        entry.buckets[bisect.bisect_left(self.buckets, value)] += 1
+        entry.count += 1
+        entry.sum += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def get(self, **labels) -> HistogramValue:
+        return self.values.get(self.label_values(labels), HistogramValue(len(self.buckets)))
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        for key, entry in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry.buckets):
+                cumulative += count
+                yield '_bucket', names, key + (format_value(bound),), cumulative
+            yield '_sum', self.labelnames, key, entry.sum
+            yield '_count', self.labelnames, key, entry.count
@@ -0,0 +1,16 @@
+from monitoring_service.metrics import Histogram
+
+RPC_SECONDS = Histogram(
+    'monitoring_service_rpc_seconds',
+    'Latency of Ethereum node JSON-RPC calls, by method',
+    ['method']
+)
+
+
+def rpc_metrics_middleware(make_request, web3):
+    """web3 middleware timing every RPC call in `RPC_SECONDS`. Install it with
+    `web3.middleware_stack.add(rpc_metrics_middleware)`"""
+    def middleware(method, params):
+        with RPC_SECONDS.time(method=method):
+            return make_request(method, params)
+    return middleware
@@ -1,18 +1,25 @@
 import logging
 import gevent
+import requests
 import sys
 import traceback
-from typing import List
 from eth_utils import is_address
 
 from monitoring_service.blockchain import BlockchainMonitor
+from monitoring_service.challenge_scheduler import ChallengeScheduler
+from monitoring_service.contract_cache import ContractCodeCache
 from monitoring_service.state_db import StateDB
-from monitoring_service.tasks import StoreBalanceProof
+from monitoring_service.tasks import (
+    StoreBalanceProof,
+    TaskQueue,
+    BalanceProofCoalescer
+)
 from monitoring_service.transport import Transport
 from monitoring_service.constants import (
     EVENT_CHANNEL_CLOSE,
     EVENT_CHANNEL_SETTLED,
-    EVENT_TRANSFER_UPDATED
+    EVENT_TRANSFER_UPDATED,
+    DEFAULT_SETTLE_TIMEOUT
 )
 from raiden_libs.messages import Message, BalanceProof
 from raiden_libs.gevent_error_handler import register_error_handler
@@ -45,7 +52,11 @@ class MonitoringService(gevent.Greenlet):
         private_key: str,
         state_db: StateDB = None,
         transport: Transport = None,
-        blockchain: BlockchainMonitor = None
+        blockchain: BlockchainMonitor = None,
+        settle_timeout: int = DEFAULT_SETTLE_TIMEOUT,
+        challenge_workers: int = 10,
+        balance_proof_workers: int = 10,
+        balance_proof_queue_size: int = 1000
     ) -> None:
         super().__init__()
         assert isinstance(private_key, str)
@@ -60,17 +71,45 @@ class MonitoringService(gevent.Greenlet):
         assert is_checksum_address(private_key_to_address(self.private_key))
         self.transport.add_message_callback(lambda message: self.on_message_event(message))
         self.transport.privkey = lambda: self.private_key
+        self.transport.message_types = [BalanceProof.__name__]
         if state_db.is_initialized() is False:
             network_id = 6
             contract_address = '0xD5BE9a680AbbF01aB2d422035A64DB27ab01C624'
             receiver = private_key_to_address(private_key)
             state_db.setup_db(network_id, contract_address, receiver)
-        self.task_list: List[gevent.Greenlet] = []
+        self.balance_proof_tasks = TaskQueue(
+            balance_proof_workers,
+            balance_proof_queue_size,
+            name='balance_proof'
+        )
+        self.stats_interval = 60
+        self.contract_cache = ContractCodeCache(self.blockchain.web3)
+        self.balance_proof_coalescer = BalanceProofCoalescer(
+            self.balance_proof_tasks,
+            lambda balance_proof: StoreBalanceProof(
+                self.blockchain.web3,
+                self.state_db,
+                balance_proof,
+                contract_cache=self.contract_cache
+            )
+        )
+        self.challenge_scheduler = ChallengeScheduler(
+            lambda channel_id: self.challenge_proof(channel_id),
+            settle_timeout=settle_timeout,
+            workers=challenge_workers,
+            block_number=lambda: self.blockchain.last_block or 0
+        )
 
     def _run(self):
         register_error_handler(error_handler)
         self.transport.start()
         self.blockchain.start()
+        self.challenge_scheduler.start()
+        self.balance_proof_tasks.start()
+        try:
+            self.contract_cache.warm([self.state_db.metadata['contract_address']])
+        except requests.exceptions.ConnectionError:
+            log.warning('Could not look up contract code, Ethereum node is not reachable')
         self.blockchain.register_handler(
             EVENT_CHANNEL_CLOSE,
             lambda event, tx: self.on_channel_close(event, tx)
@@ -84,20 +123,20 @@ class MonitoringService(gevent.Greenlet):
             lambda event, tx: self.on_transfer_updated(event, tx)
         )
 
-        # this loop will wait until spawned greenlets complete
-        while self.stop_event.is_set() is False:
-            tasks = gevent.wait(self.task_list, timeout=5, count=1)
-            if len(tasks) == 0:
-                gevent.sleep(5)
-                continue
-            task = tasks[0]
-            self.task_list.remove(task)
+        while self.stop_event.wait(self.stats_interval) is False:
+            stats = self.balance_proof_tasks.stats()
+            log.info('balance proofs: succeeded=%d rejected=%d failed=%d coalesced=%d '
+                     'queued_channels=%d',
+                     stats['succeeded'], stats['rejected'], stats['failed'],
+                     self.balance_proof_coalescer.coalesced_count, stats['queue_depth'])
 
     def stop(self):
         self.stop_event.set()
+        self.challenge_scheduler.kill()
+        self.balance_proof_tasks.stop()
 
     def on_channel_close(self, event, tx):
-        log.info('on channel close: event=%s tx=%s' % (event, tx))
+        log.info('on channel close: event=%s tx=%s', event, tx)
         # check if we have balance proof for the closing
         closing_participant = event['args']['closing_participant']
         channel_id = event['args']['channel_identifier']
@@ -117,14 +156,15 @@ class MonitoringService(gevent.Greenlet):
 
         # check if we should challenge closeChannel
         if self.check_event(event, balance_proof) is False:
-            log.warning('Invalid balance proof submitted! Challenging! event=%s' % event)
-            self.challenge_proof(channel_id)
+            log.warning('Invalid balance proof submitted! Challenging! event=%s', event)
+            self.challenge_scheduler.schedule(channel_id, event['blockNumber'])
 
     def on_channel_settled(self, event, tx):
+        self.challenge_scheduler.cancel(event['args']['channel_identifier'])
         self.state_db.delete_balance_proof(event['args']['channel_identifier'])
 
     def on_transfer_updated(self, event, tx):
-        log.warning('transferUpdated event! event=%s' % event)
+        log.warning('transferUpdated event! event=%s', event)
 
     def check_event(self, event, balance_proof: BalanceProof):
         return False
@@ -133,7 +173,7 @@ class MonitoringService(gevent.Greenlet):
         balance_proof = self.state_db.balance_proofs.get(
             channel_id, None
         )
-        log.info('challenging proof channel=%s BP=%s' % (channel_id, balance_proof))
+        log.info('challenging proof channel=%s BP=%s', channel_id, balance_proof)
 
     def on_message_event(self, message):
         """This handles messages received over the Transport"""
@@ -143,20 +183,18 @@ class MonitoringService(gevent.Greenlet):
 
     def on_balance_proof(self, balance_proof):
         """Called whenever a balance proof message is received.
-        This will spawn a greenlet and store its reference in an internal list.
-        Return value of the greenlet is then checked in the main loop."""
+        The balance proof is queued for a `StoreBalanceProof` worker, replacing an older
+        one of the same channel that is still waiting. While the queue is full this
+        blocks, holding up the transport.
+        Returns an `AsyncResult` set to the finished task, or to None if the balance
+        proof was replaced by a newer one"""
         assert isinstance(balance_proof, BalanceProof)
-        task = StoreBalanceProof(self.blockchain.web3, self.state_db, balance_proof)
-        task.start()
-        self.task_list.append(task)
+        return self.balance_proof_coalescer.submit(balance_proof)
 
     @property
     def balance_proofs(self):
         return self.state_db.balance_proofs
 
-    def wait_tasks(self):
+    def wait_tasks(self, timeout: float = None):
         """Wait until all internal tasks are finished"""
-        while True:
-            if len(self.task_list) == 0:
-                return
-            gevent.sleep(1)
+        return self.balance_proof_tasks.join(timeout)
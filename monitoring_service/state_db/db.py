@@ -1,8 +1,33 @@
 import sqlite3
 import os
+import pathlib
+import bisect
+import itertools
+from collections import deque
+from gevent.event import AsyncResult
+from gevent.monkey import get_original
+from gevent.threadpool import ThreadPool
 from eth_utils import is_checksum_address
+from monitoring_service.metrics import Histogram
 
-from .queries import DB_CREATION_SQL, ADD_BALANCE_PROOF_SQL, UPDATE_METADATA_SQL
+from .encoding import (
+    encode_balance_proof,
+    decode_balance_proof,
+    encode_channel_id,
+    balance_proof_entry
+)
+from .migrations import upgrade_schema
+from .writer import StateDBWriter
+from .queries import (
+    SCHEMA_VERSION,
+    DB_CREATION_SQL,
+    ADD_BALANCE_PROOF_SQL,
+    DELETE_BALANCE_PROOF_SQL,
+    UPDATE_METADATA_SQL,
+    UPDATE_SCHEMA_VERSION_SQL,
+    UPDATE_SYNCSTATE_SQL,
+    UPDATE_TRANSPORT_STATE_SQL
+)
 
 
 def dict_factory(cursor, row):
@@ -20,73 +45,324 @@ def check_balance_proof(bp):
         assert is_checksum_address(bp['participant2'])
 
 
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+STATE_DB_SECONDS = Histogram(
+    'monitoring_service_state_db_seconds',
+    'Latency of state DB operations: reads, in-memory queries and batch commits',
+    ['operation']
+)
+
+# native thread id, also when the threading module is monkey patched
+get_thread_ident = get_original('_thread', 'get_ident')
+
+
 class StateDB:
-    def __init__(self, filename):
+    """Balance proof storage.
+
+    All stored balance proofs are kept in an in-memory index keyed by channel id.
+    The index is loaded once when the database is opened and kept up to date by
+    `store_balance_proof` and `delete_balance_proof`, so lookups never hit sqlite.
+    `version` counts changes to the index; `query_balance_proofs` pages through it in
+    channel id order. Callbacks added with `add_change_listener` are called with the
+    channel id of every stored or deleted balance proof (None if the whole index was
+    reloaded).
+
+    Every store and delete gets the next `version` as its sequence number. The last
+    `change_log_size` of them are kept in a change log, which `changes_since` reads
+    to find the channels changed after a given sequence number. Versions are not
+    stored and start over whenever the database is opened; `epoch` is a random id
+    of the opened database, so versions are only comparable within the same epoch.
+
+    Databases created with an older schema are upgraded in place when opened.
+
+    Writes are handed to a `StateDBWriter` greenlet which commits them in batches.
+    `store_balance_proof` and `delete_balance_proof` update the index immediately
+    and return an AsyncResult that is set once the change is on disk. If a commit
+    fails, the index is ahead of the database; the writer then refuses all further
+    writes and exits with the error instead of letting the two drift apart.
+
+    Parameters:
+        filename: sqlite database file, or ':memory:'
+        synchronous: sqlite `PRAGMA synchronous` level. With WAL, NORMAL may lose
+            the last commits on power loss but never corrupts the database.
+        batch_size, max_latency: group commit bounds, see `StateDBWriter`
+        read_threads: if > 0, sqlite work is moved off the gevent hub: writes run in a
+            dedicated writer thread and reads in a pool of `read_threads` threads,
+            each with its own read-only connection. File databases only. Setup and
+            schema upgrades still run on the hub, holding the writer's lock.
+    """
+    def __init__(
+        self,
+        filename: str,
+        synchronous: str = 'NORMAL',
+        batch_size: int = 1000,
+        max_latency: float = 0.05,
+        read_threads: int = 0,
+        change_log_size: int = 100000
+    ) -> None:
+        assert synchronous in SYNCHRONOUS_LEVELS
+        assert read_threads >= 0
+        is_file = filename not in (None, ':memory:')
+        assert is_file or read_threads == 0, 'in-memory DB can not be shared between threads'
         self.filename = filename
-        self.conn = sqlite3.connect(self.filename, isolation_level="EXCLUSIVE")
+        # transactions are managed explicitly by the writer
+        self.conn = sqlite3.connect(
+            self.filename,
+            isolation_level=None,
+            check_same_thread=(read_threads == 0)
+        )
         self.conn.row_factory = dict_factory
-        if filename not in (None, ':memory:'):
+        if is_file:
             os.chmod(filename, 0o600)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=%s' % synchronous)
+        self.write_pool = None
+        self.read_pool = None
+        self._read_connections = {}
+        if read_threads > 0:
+            self.write_pool = ThreadPool(1)
+            self.read_pool = ThreadPool(read_threads)
+        self.writer = StateDBWriter(
+            self.conn,
+            batch_size,
+            max_latency,
+            self.write_pool,
+            on_commit=lambda seconds: STATE_DB_SECONDS.observe(seconds, operation='commit')
+        )
+        self.writer.start()
+        self._balance_proofs = {}
+        # channel ids of `_balance_proofs`, sorted
+        self._channel_ids: list = []
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.change_listeners: list = []
+        # (sequence number, channel id), the sequence numbers are consecutive
+        self.change_log: deque = deque(maxlen=change_log_size)
+        self._sync_state = {}
+        self._metadata = {}
+        self._transport_state = {}
+        if self.is_initialized():
+            with self.writer.lock:
+                upgrade_schema(self.conn)
+            self._load_balance_proofs()
+            self._load_sync_state()
+            self._load_metadata()
+            self._load_transport_state()
 
     def setup_db(self, network_id: int, contract_address: str, receiver: str):
         """Initialize an empty database. Call this if `is_initialized()` returns False"""
         assert is_checksum_address(receiver)
         assert is_checksum_address(contract_address)
         assert network_id >= 0
-        self.conn.executescript(DB_CREATION_SQL)
-        self.conn.execute(UPDATE_METADATA_SQL, [network_id, contract_address, receiver])
-        self.conn.commit()
+        with self.writer.lock:
+            self.conn.executescript(DB_CREATION_SQL)
+            self.conn.execute(UPDATE_METADATA_SQL, [network_id, contract_address, receiver])
+            self.conn.execute(UPDATE_SCHEMA_VERSION_SQL, [SCHEMA_VERSION])
+            self.conn.commit()
+        self._load_balance_proofs()
+        self._load_sync_state()
+        self._load_metadata()
+        self._load_transport_state()
 
-    @property
-    def balance_proofs(self) -> dict:
-        c = self.conn.cursor()
-        c.execute('SELECT * FROM `balance_proofs`')
-        ret = []
-        for x in c.fetchall():
-            x['channel_id'] = int(x['channel_id'], 16)
-            x['transferred_amount'] = int(x['transferred_amount'], 16)
-            x['nonce'] = int(x['nonce'], 16)
-            ret.append(x)
+    def _read_connection(self):
+        """read-only connection of the calling read pool thread"""
+        ident = get_thread_ident()
+        conn = self._read_connections.get(ident, None)
+        if conn is None:
+            conn = sqlite3.connect(
+                pathlib.Path(os.path.abspath(self.filename)).as_uri() + '?mode=ro',
+                uri=True,
+                check_same_thread=False
+            )
+            conn.row_factory = dict_factory
+            self._read_connections[ident] = conn
+        return conn
+
+    def _run_read(self, fn, args):
+        return fn(self._read_connection(), *args)
+
+    def _read(self, fn, *args):
+        """Run `fn(conn, *args)`, in the read pool if there is one.
+        The calling greenlet blocks, but the hub keeps running."""
+        with STATE_DB_SECONDS.time(operation='read'):
+            if self.read_pool is None:
+                with self.writer.lock:
+                    return fn(self.conn, *args)
+            return self.read_pool.apply(self._run_read, (fn, args))
 
+    @staticmethod
+    def _select_balance_proofs(conn) -> dict:
+        c = conn.execute('SELECT * FROM `balance_proofs`')
         return {
             x['channel_id']: x
-            for x in ret
+            for x in (decode_balance_proof(row) for row in c.fetchall())
         }
 
-    def store_balance_proof(self, balance_proof) -> None:
-        check_balance_proof(balance_proof)
+    def _load_balance_proofs(self):
+        self._balance_proofs = self._read(self._select_balance_proofs)
+        self._channel_ids = sorted(self._balance_proofs)
+        self.version += 1
+        self._notify_change(None)
+
+    def add_change_listener(self, callback) -> None:
+        self.change_listeners.append(callback)
+
+    def changes_since(self, seq: int) -> list:
+        """Channels changed after sequence number `seq`, as (sequence number, channel id)
+        of their last change, ordered by sequence number. Returns None if changes after
+        `seq` are no longer in the change log, or `seq` is in the future"""
+        if seq > self.version:
+            return None
+        first_seq = self.change_log[0][0] if len(self.change_log) > 0 else self.version + 1
+        if seq < first_seq - 1:
+            return None
+        last_change = {}
+        for change_seq, channel_id in itertools.islice(
+            self.change_log,
+            seq + 1 - first_seq,
+            None
+        ):
+            last_change[channel_id] = change_seq
+        return sorted((v, k) for k, v in last_change.items())
+
+    def _notify_change(self, channel_id) -> None:
+        if channel_id is None:
+            self.change_log.clear()
+        else:
+            self.change_log.append((self.version, channel_id))
+        for callback in self.change_listeners:
+            callback(channel_id)
+
+    def _load_sync_state(self):
+        self._sync_state = self._read(
+            lambda conn: conn.execute('SELECT * FROM `syncstate`').fetchone()
+        )
+
+    def _load_metadata(self):
+        self._metadata = self._read(
+            lambda conn: conn.execute('SELECT * FROM `metadata`').fetchone()
+        )
+
+    @property
+    def metadata(self) -> dict:
+        """Network id, contract address and receiver the database was set up for"""
+        return dict(self._metadata)
+
+    @property
+    def sync_state(self) -> dict:
+        """Blockchain sync progress: confirmed/unconfirmed head numbers and hashes"""
+        return dict(self._sync_state)
+
+    def update_sync_state(
+        self,
+        confirmed_head_number: int,
+        confirmed_head_hash: str,
+        unconfirmed_head_number: int,
+        unconfirmed_head_hash: str
+    ) -> AsyncResult:
         params = [
-            hex(balance_proof['channel_id']),
-            balance_proof['contract_address'],
-            balance_proof['participant1'],
-            balance_proof['participant2'],
-            hex(balance_proof['nonce']),
-            hex(balance_proof['transferred_amount']),
-            balance_proof['extra_hash'],
-            balance_proof['signature'],
-            balance_proof['timestamp'],
-            balance_proof['chain_id']
+            confirmed_head_number,
+            confirmed_head_hash,
+            unconfirmed_head_number,
+            unconfirmed_head_hash
         ]
-        self.conn.execute(ADD_BALANCE_PROOF_SQL, params)
+        self._sync_state = {
+            'confirmed_head_number': confirmed_head_number,
+            'confirmed_head_hash': confirmed_head_hash,
+            'unconfirmed_head_number': unconfirmed_head_number,
+            'unconfirmed_head_hash': unconfirmed_head_hash
+        }
+        return self.writer.submit(UPDATE_SYNCSTATE_SQL, params)
+
+    def _load_transport_state(self):
+        rows = self._read(
+            lambda conn: conn.execute('SELECT * FROM `transport_state`').fetchall()
+        )
+        self._transport_state = {x['key']: x['value'] for x in rows}
+
+    def get_transport_state(self, key: str, default: str = None) -> str:
+        """Value stored by the transport under `key`, e.g. its sync position"""
+        return self._transport_state.get(key, default)
+
+    def set_transport_state(self, key: str, value: str) -> AsyncResult:
+        self._transport_state[key] = value
+        return self.writer.submit(UPDATE_TRANSPORT_STATE_SQL, [key, value])
 
-    def get_balance_proof(self, channel_id: int) -> None:
+    @property
+    def balance_proofs(self) -> dict:
+        """Stored balance proofs, keyed by channel id.
+        This is the live index - callers must not modify it."""
+        return self._balance_proofs
+
+    def store_balance_proof(self, balance_proof) -> AsyncResult:
+        check_balance_proof(balance_proof)
+        channel_id = balance_proof['channel_id']
+        if channel_id not in self._balance_proofs:
+            bisect.insort(self._channel_ids, channel_id)
+        self._balance_proofs[channel_id] = balance_proof_entry(balance_proof)
+        self.version += 1
+        self._notify_change(channel_id)
+        return self.writer.submit(ADD_BALANCE_PROOF_SQL, encode_balance_proof(balance_proof))
+
+    def get_balance_proof(self, channel_id: int) -> dict:
         assert channel_id > 0
         # TODO unconfirmed topups
-        c = self.conn.cursor()
-        sql = 'SELECT rowid,* FROM `balance_proofs` WHERE `channel_id` = ?'
-        c.execute(sql, [hex(channel_id)])
-        result = c.fetchone()
-        assert c.fetchone() is None
-        return result
-
-    def delete_balance_proof(self, channel_id: int) -> None:
+        return self._balance_proofs.get(channel_id, None)
+
+    def query_balance_proofs(
+        self,
+        after: int = None,
+        limit: int = None,
+        participant: str = None,
+        contract_address: str = None,
+        min_timestamp: int = None,
+        max_timestamp: int = None
+    ) -> list:
+        """Up to `limit` stored balance proofs with a channel id greater than `after`,
+        ordered by channel id. Only proofs matching all given filters are returned"""
+        with STATE_DB_SECONDS.time(operation='query'):
+            start = 0 if after is None else bisect.bisect_right(self._channel_ids, after)
+            result = []
+            for i in range(start, len(self._channel_ids)):
+                if limit is not None and len(result) >= limit:
+                    break
+                bp = self._balance_proofs[self._channel_ids[i]]
+                if participant is not None and \
+                        participant not in (bp['participant1'], bp['participant2']):
+                    continue
+                if contract_address is not None and bp['contract_address'] != contract_address:
+                    continue
+                if min_timestamp is not None and bp['timestamp'] < min_timestamp:
+                    continue
+                if max_timestamp is not None and bp['timestamp'] > max_timestamp:
+                    continue
+                result.append(bp)
+            return result
+
+    def delete_balance_proof(self, channel_id: int) -> AsyncResult:
         assert channel_id > 0
-        c = self.conn.cursor()
-        sql = 'DELETE FROM `balance_proofs` WHERE `channel_id` = ?'
-        c.execute(sql, [hex(channel_id)])
-        assert c.fetchone() is None
+        if self._balance_proofs.pop(channel_id, None) is not None:
+            del self._channel_ids[bisect.bisect_left(self._channel_ids, channel_id)]
+            self.version += 1
+            self._notify_change(channel_id)
+        return self.writer.submit(DELETE_BALANCE_PROOF_SQL, [encode_channel_id(channel_id)])
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until all pending writes are committed"""
+        return self.writer.flush(timeout)
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.kill()
+        if self.read_pool is not None:
+            self.read_pool.kill()
+            self.write_pool.kill()
+            [conn.close() for conn in self._read_connections.values()]
+        self.conn.close()
 
     def is_initialized(self) -> bool:
-        c = self.conn.cursor()
-        c.execute("SELECT name FROM `sqlite_master` WHERE type='table' AND name='metadata'")
-        return c.fetchone() is not None
+        with self.writer.lock:
+            c = self.conn.cursor()
+            c.execute("SELECT name FROM `sqlite_master` WHERE type='table' AND name='metadata'")
+            return c.fetchone() is not None
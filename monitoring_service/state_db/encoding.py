@@ -0,0 +1,68 @@
+"""Conversion between balance proof dicts and their binary `balance_proofs` rows"""
+from eth_utils import decode_hex, encode_hex, to_checksum_address
+
+from .queries import BALANCE_PROOF_COLUMNS
+
+CHANNEL_ID_SIZE = 32
+TRANSFERRED_AMOUNT_SIZE = 32
+NONCE_SIZE = 8
+
+
+def encode_uint(value: int, size: int) -> bytes:
+    return value.to_bytes(size, byteorder='big')
+
+
+def decode_uint(value: bytes) -> int:
+    return int.from_bytes(value, byteorder='big')
+
+
+def encode_channel_id(channel_id: int) -> bytes:
+    return encode_uint(channel_id, CHANNEL_ID_SIZE)
+
+
+def encode_address(address: str) -> bytes:
+    return decode_hex(address)
+
+
+def decode_address(value: bytes) -> str:
+    return to_checksum_address(encode_hex(value))
+
+
+def encode_balance_proof(bp: dict) -> list:
+    """make `ADD_BALANCE_PROOF_SQL` parameters out of a balance proof dict"""
+    return [
+        encode_channel_id(bp['channel_id']),
+        encode_address(bp['contract_address']),
+        encode_address(bp['participant1']),
+        encode_address(bp['participant2']),
+        encode_uint(bp['nonce'], NONCE_SIZE),
+        encode_uint(bp['transferred_amount'], TRANSFERRED_AMOUNT_SIZE),
+        decode_hex(bp['extra_hash']),
+        decode_hex(bp['signature']),
+        bp['timestamp'],
+        bp['chain_id']
+    ]
+
+
+def decode_balance_proof(row: dict) -> dict:
+    """inverse of `encode_balance_proof`, for rows read from sqlite"""
+    return {
+        'channel_id': decode_uint(row['channel_id']),
+        'contract_address': decode_address(row['contract_address']),
+        'participant1': decode_address(row['participant1']),
+        'participant2': decode_address(row['participant2']),
+        'nonce': decode_uint(row['nonce']),
+        'transferred_amount': decode_uint(row['transferred_amount']),
+        'extra_hash': encode_hex(row['extra_hash']),
+        'signature': encode_hex(row['signature']),
+        'timestamp': row['timestamp'],
+        'chain_id': row['chain_id']
+    }
+
+
+def balance_proof_entry(bp: dict) -> dict:
+    """strip a serialized balance proof down to the stored columns"""
+    return {
+        column: bp[column]
+        for column in BALANCE_PROOF_COLUMNS
+    }
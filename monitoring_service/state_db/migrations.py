@@ -0,0 +1,80 @@
+"""In-place upgrades of existing state databases to the current schema"""
+import logging
+
+from eth_utils import to_checksum_address
+
+from .encoding import encode_balance_proof
+from .queries import (
+    SCHEMA_VERSION,
+    BALANCE_PROOFS_TABLE_SQL,
+    BALANCE_PROOFS_INDEX_SQL,
+    TRANSPORT_STATE_TABLE_SQL,
+    ADD_BALANCE_PROOF_SQL,
+    UPDATE_SCHEMA_VERSION_SQL
+)
+
+log = logging.getLogger(__name__)
+
+
+def get_schema_version(conn) -> int:
+    """Databases created before schema versioning was introduced are version 1"""
+    columns = [x['name'] for x in conn.execute('PRAGMA table_info(`metadata`)').fetchall()]
+    if 'schema_version' not in columns:
+        return 1
+    row = conn.execute('SELECT `schema_version` FROM `metadata`').fetchone()
+    if row is None or row['schema_version'] is None:
+        return 1
+    return row['schema_version']
+
+
+def migrate_v1_to_v2(conn):
+    """Convert hex encoded `balance_proofs` to the binary, channel_id keyed table.
+    v1 had no unique key, so a channel may have several rows - the newest one wins."""
+    conn.execute('ALTER TABLE `balance_proofs` RENAME TO `balance_proofs_v1`')
+    # executescript() would commit the migration transaction, run statements one by one
+    for statement in [BALANCE_PROOFS_TABLE_SQL] + BALANCE_PROOFS_INDEX_SQL:
+        conn.execute(statement)
+    rows = conn.execute(
+        'SELECT * FROM `balance_proofs_v1` ORDER BY `timestamp`, rowid'
+    ).fetchall()
+    for row in rows:
+        bp = dict(row)
+        bp['channel_id'] = int(row['channel_id'], 16)
+        bp['nonce'] = int(row['nonce'], 16)
+        bp['transferred_amount'] = int(row['transferred_amount'], 16)
+        for address in ('contract_address', 'participant1', 'participant2'):
+            bp[address] = to_checksum_address(row[address])
+        conn.execute(ADD_BALANCE_PROOF_SQL, encode_balance_proof(bp))
+    conn.execute('DROP TABLE `balance_proofs_v1`')
+    conn.execute('ALTER TABLE `metadata` ADD COLUMN `schema_version` INTEGER')
+    log.info('migrated %d balance proofs to schema v2', len(rows))
+
+
+def migrate_v2_to_v3(conn):
+    """Add the `transport_state` table"""
+    conn.execute(TRANSPORT_STATE_TABLE_SQL)
+
+
+MIGRATIONS = {
+    1: migrate_v1_to_v2,
+    2: migrate_v2_to_v3,
+}
+
+
+def upgrade_schema(conn) -> None:
+    """Run all migrations needed to bring `conn` to `SCHEMA_VERSION`.
+    Each step runs in its own exclusive transaction."""
+    version = get_schema_version(conn)
+    assert version <= SCHEMA_VERSION, 'state DB was created by a newer version'
+    while version < SCHEMA_VERSION:
+        log.info('upgrading state DB schema v%d -> v%d', version, version + 1)
+        conn.commit()
+        conn.execute('BEGIN EXCLUSIVE')
+        try:
+            MIGRATIONS[version](conn)
+            conn.execute(UPDATE_SCHEMA_VERSION_SQL, [version + 1])
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        version += 1
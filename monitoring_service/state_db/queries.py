@@ -1,8 +1,42 @@
-DB_CREATION_SQL = """
+SCHEMA_VERSION = 3
+
+# channel_id is uint256, stored as 32 big-endian bytes
+# transferred_amount is uint256, stored as 32 big-endian bytes
+# nonce is uint64, stored as 8 big-endian bytes
+# addresses are stored as 20 raw bytes, hashes and signatures as raw bytes
+BALANCE_PROOFS_TABLE_SQL = """
+CREATE TABLE `balance_proofs` (
+    `channel_id`        BLOB(32)    NOT NULL PRIMARY KEY,
+    `contract_address`  BLOB(20)    NOT NULL,
+    `participant1`      BLOB(20)    NOT NULL,
+    `participant2`      BLOB(20)    NOT NULL,
+    `nonce`             BLOB(8)     NOT NULL,
+    `transferred_amount` BLOB(32)   NOT NULL,
+    `extra_hash`        BLOB(32)    NOT NULL,
+    `signature`         BLOB(65)    NOT NULL,
+    `timestamp`         INT         NOT NULL,
+    `chain_id`          INT         NOT NULL
+)"""
+
+BALANCE_PROOFS_INDEX_SQL = [
+    'CREATE INDEX `balance_proofs_participant1` ON `balance_proofs` (`participant1`)',
+    'CREATE INDEX `balance_proofs_participant2` ON `balance_proofs` (`participant2`)',
+    'CREATE INDEX `balance_proofs_contract_address` ON `balance_proofs` (`contract_address`)',
+]
+
+# key/value state of the transport, e.g. the Matrix sync token
+TRANSPORT_STATE_TABLE_SQL = """
+CREATE TABLE `transport_state` (
+    `key`               TEXT        NOT NULL PRIMARY KEY,
+    `value`             TEXT
+)"""
+
+DB_CREATION_SQL = TRANSPORT_STATE_TABLE_SQL + """;
 CREATE TABLE `metadata` (
     `network_id`       INTEGER,
     `contract_address` CHAR(42),
-    `receiver`         CHAR(42)
+    `receiver`         CHAR(42),
+    `schema_version`   INTEGER
 );
 CREATE TABLE `syncstate` (
     `confirmed_head_number`   INTEGER,
@@ -10,23 +44,9 @@ CREATE TABLE `syncstate` (
     `unconfirmed_head_number` INTEGER,
     `unconfirmed_head_hash`   CHAR(66)
 );
-
--- channel_id is uint256
--- transferred_amount is uint256
--- nonce is uint64
-CREATE TABLE `balance_proofs` (
-    `channel_id`        CHAR(34)    NOT NULL,
-    `contract_address`  CHAR(42)    NOT NULL,
-    `participant1`      CHAR(42)    NOT NULL,
-    `participant2`      CHAR(42)    NOT NULL,
-    `nonce`             CHAR(34)    NOT NULL,
-    `transferred_amount` CHAR(34)   NOT NULL,
-    `extra_hash`        CHAR(32)    NOT NULL,
-    `signature`         CHAR(160)   NOT NULL,
-    `timestamp`         INT         NOT NULL,
-    `chain_id`          INT         NOT NULL
-);
+""" + ';\n'.join([BALANCE_PROOFS_TABLE_SQL] + BALANCE_PROOFS_INDEX_SQL) + """;
 INSERT INTO `metadata` VALUES (
+    NULL,
     NULL,
     NULL,
     NULL
@@ -39,15 +59,58 @@ INSERT INTO `syncstate` VALUES (
 );
 """
 
+BALANCE_PROOF_COLUMNS = (
+    'channel_id',
+    'contract_address',
+    'participant1',
+    'participant2',
+    'nonce',
+    'transferred_amount',
+    'extra_hash',
+    'signature',
+    'timestamp',
+    'chain_id'
+)
 
 ADD_BALANCE_PROOF_SQL = """
-INSERT OR REPLACE INTO `balance_proofs` VALUES (
+INSERT OR REPLACE INTO `balance_proofs` (
+    `channel_id`,
+    `contract_address`,
+    `participant1`,
+    `participant2`,
+    `nonce`,
+    `transferred_amount`,
+    `extra_hash`,
+    `signature`,
+    `timestamp`,
+    `chain_id`
+) VALUES (
     ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
 );"""
 
+DELETE_BALANCE_PROOF_SQL = """
+DELETE FROM `balance_proofs` WHERE `channel_id` = ?;
+"""
+
 UPDATE_METADATA_SQL = """
 UPDATE `metadata` SET
     `network_id` = ?,
     `contract_address` = ?,
     `receiver` = ?;
 """
+
+UPDATE_SCHEMA_VERSION_SQL = """
+UPDATE `metadata` SET `schema_version` = ?;
+"""
+
+UPDATE_SYNCSTATE_SQL = """
+UPDATE `syncstate` SET
+    `confirmed_head_number` = ?,
+    `confirmed_head_hash` = ?,
+    `unconfirmed_head_number` = ?,
+    `unconfirmed_head_hash` = ?;
+"""
+
+UPDATE_TRANSPORT_STATE_SQL = """
+INSERT OR REPLACE INTO `transport_state` (`key`, `value`) VALUES (?, ?);
+"""
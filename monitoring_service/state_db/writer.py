@@ -0,0 +1,135 @@
+import time
+import logging
+import gevent
+import gevent.queue
+import gevent.lock
+from gevent.event import AsyncResult
+
+log = logging.getLogger(__name__)
+
+# submitted in place of a query to wake up everyone waiting for the queue to drain
+_FLUSH = object()
+
+
+class StateDBWriter(gevent.Greenlet):
+    """Group commit for StateDB writes.
+
+    Queries are queued by `submit()` and executed by this greenlet in batches; one
+    transaction is committed per batch. A batch is closed once it holds `batch_size`
+    queries or `max_latency` seconds after its first query arrived.
+
+    Every submitted query gets an AsyncResult that is set after its batch has been
+    committed (or set to the exception if the batch failed and was rolled back).
+
+    A failed batch stops the writer: the StateDB index already holds its changes, so
+    later writes must not be committed on top of a database that no longer matches
+    it. Queued and later queries get the same exception, and the greenlet exits with
+    it, which terminates the service through the gevent error handler.
+
+    If `threadpool` is given, batches are executed there instead of on the hub.
+    It must have a single thread, as `conn` is not safe for concurrent use. For the
+    same reason, anyone else using `conn` must hold `lock`, which is held while a
+    batch is executed.
+
+    `on_commit`, if given, is called with the duration of every batch commit in
+    seconds.
+    """
+    def __init__(
+        self,
+        conn,
+        batch_size: int = 1000,
+        max_latency: float = 0.05,
+        threadpool=None,
+        on_commit=None
+    ) -> None:
+        super().__init__()
+        assert batch_size > 0
+        assert max_latency >= 0
+        assert threadpool is None or threadpool.maxsize == 1
+        self.conn = conn
+        self.threadpool = threadpool
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = gevent.queue.Queue()
+        self.lock = gevent.lock.RLock()
+        self.commit_count = 0
+        self.write_count = 0
+        # exception of the failed batch that stopped the writer
+        self.error = None
+
+    def submit(self, sql: str, params) -> AsyncResult:
+        result = AsyncResult()
+        if self.error is not None:
+            result.set_exception(self.error)
+        else:
+            self.queue.put((sql, params, result))
+        return result
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until everything submitted so far is committed.
+        Returns False on timeout or if a commit failed"""
+        return self.submit(_FLUSH, None).wait(timeout) is not None
+
+    def fail(self, error: Exception) -> None:
+        """Fail all queued queries and refuse new ones"""
+        self.error = error
+        while not self.queue.empty():
+            _, _, result = self.queue.get_nowait()
+            result.set_exception(error)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def next_batch(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except gevent.queue.Empty:
+                break
+        return batch
+
+    def execute_batch(self, queries: list):
+        """Run `queries` in one transaction. Returns the exception if it failed."""
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+            for sql, params, _ in queries:
+                self.conn.execute(sql, params)
+            self.conn.execute('COMMIT')
+        except Exception as e:
+            if self.conn.in_transaction:
+                self.conn.execute('ROLLBACK')
+            return e
+        return None
+
+    def commit_batch(self, batch: list) -> None:
+        queries = [x for x in batch if x[0] is not _FLUSH]
+        error = None
+        if queries:
+            with self.lock:
+                start = time.monotonic()
+                if self.threadpool is not None:
+                    error = self.threadpool.apply(self.execute_batch, (queries,))
+                else:
+                    error = self.execute_batch(queries)
+            if self.on_commit is not None:
+                self.on_commit(time.monotonic() - start)
+        if error is not None:
+            log.error('StateDB batch commit failed (%d queries): %s', len(queries), error)
+            [result.set_exception(error) for _, _, result in batch]
+            self.fail(error)
+            raise error
+        self.commit_count += 1 if queries else 0
+        self.write_count += len(queries)
+        [result.set(True) for _, _, result in batch]
+
+    def _run(self):
+        while True:
+            self.commit_batch(self.next_batch())
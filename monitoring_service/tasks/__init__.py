@@ -1,5 +1,9 @@
 from .store_balance_proof import StoreBalanceProof
+from .task_queue import TaskQueue
+from .coalescer import BalanceProofCoalescer
 
 __all__ = [
-    'StoreBalanceProof'
+    'StoreBalanceProof',
+    'TaskQueue',
+    'BalanceProofCoalescer'
 ]
@@ -0,0 +1,85 @@
+import logging
+import gevent
+import gevent.event
+
+log = logging.getLogger(__name__)
+
+
+def balance_proof_order(balance_proof):
+    """Sort key of balance proofs of one channel: higher nonce, then newer timestamp wins"""
+    return (balance_proof.nonce, balance_proof.timestamp)
+
+
+class BalanceProofCoalescer:
+    """Keep only the newest waiting balance proof of each channel.
+
+    A burst of balance proofs for one channel would otherwise validate and store
+    each of them, and their tasks would race on the stored proof. Instead, at most
+    one task per channel is queued or running. Proofs received meanwhile replace the
+    waiting one if they are newer and are dropped otherwise, before any RPC or
+    database work. When the channel's task is done with one proof it continues with
+    the one waiting, if any.
+
+    `submit` returns an `AsyncResult` per balance proof. It is set to the finished
+    task once the proof was validated, or to None if a newer proof replaced it. A
+    failed task does not stop the channel's next proof from being validated; if the
+    channel task itself dies, its waiting proof's result gets the exception.
+
+    Parameters:
+        task_queue: `TaskQueue` to run channel tasks in. The outcome of every
+            validated proof is counted in its stats
+        make_task: returns an unstarted task greenlet validating a balance proof
+    """
+    def __init__(self, task_queue, make_task) -> None:
+        self.task_queue = task_queue
+        self.make_task = make_task
+        # channel id -> (newest balance proof not picked up by a task yet, its result)
+        self.pending: dict = {}
+        # channels with a queued or running task
+        self.active: set = set()
+        self.coalesced_count = 0
+
+    def submit(self, balance_proof) -> gevent.event.AsyncResult:
+        channel_id = balance_proof.channel_id
+        result = gevent.event.AsyncResult()
+        waiting = self.pending.get(channel_id, None)
+        if waiting is not None:
+            self.coalesced_count += 1
+            if balance_proof_order(balance_proof) <= balance_proof_order(waiting[0]):
+                result.set(None)
+                return result
+            waiting[1].set(None)
+        self.pending[channel_id] = (balance_proof, result)
+        if channel_id in self.active:
+            return result
+        self.active.add(channel_id)
+        try:
+            self.task_queue.put(gevent.Greenlet(self.run_channel, channel_id), counted=False)
+        except BaseException:
+            self.active.discard(channel_id)
+            self.pending.pop(channel_id, None)
+            raise
+        return result
+
+    def run_channel(self, channel_id):
+        """Validate the waiting balance proofs of a channel, one at a time, until none
+        is left. Returns the result of the last task, or raises its exception"""
+        task, task_result = None, None
+        try:
+            while channel_id in self.pending:
+                balance_proof, task_result = self.pending.pop(channel_id)
+                task = self.make_task(balance_proof)
+                task.start()
+                task.join()
+                self.task_queue.count_outcome(task)
+                task_result.set(task)
+        except BaseException as e:
+            # nothing would pick up the channel's waiting proof any more
+            _, waiting = self.pending.pop(channel_id, (None, None))
+            for result in (task_result, waiting):
+                if result is not None and result.ready() is False:
+                    result.set_exception(e)
+            raise
+        finally:
+            self.active.discard(channel_id)
+        return task.get()
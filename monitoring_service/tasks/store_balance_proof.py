@@ -5,54 +5,71 @@ from monitoring_service.constants import (
 )
 import logging
 from hexbytes import HexBytes
+from monitoring_service.tasks.validation import (
+    ValidationPipeline,
+    COST_LOCAL,
+    COST_STATE,
+    COST_RPC
+)
+from monitoring_service.metrics import Histogram
 
 log = logging.getLogger(__name__)
 
+BALANCE_PROOF_STAGE_SECONDS = Histogram(
+    'monitoring_service_balance_proof_stage_seconds',
+    'Time spent in the stages of StoreBalanceProof',
+    ['stage']
+)
+
 
 class StoreBalanceProof(gevent.Greenlet):
     """Validate & store submitted balance proof. This consists of:
             - checking if on-chain data (i.e. channel address) are valid
             - verify the balance proof hash itself
             - verify balance proof age
+        Checks are run by `validation`, cheapest first, until one fails.
         Parameters:
             web3: web3 instance
             balance_proof: a balance proof message.
+            contract_cache: optional `ContractCodeCache` to look contract code up in
         Return:
-            True if balance proof is usable
+            True if balance proof is usable. If not, `failed_check` is the name of the
+            check that rejected it
     """
-    def __init__(self, web3, state_db, balance_proof):
+    def __init__(self, web3, state_db, balance_proof, contract_cache=None):
         super().__init__()
+        self.contract_cache = contract_cache
         self.balance_proof = balance_proof
         self.state_db = state_db
         self.web3 = web3
+        self.failed_check = None
+
+    validation = ValidationPipeline('balance_proof')
 
     def _run(self):
-        checks = [
-            self.verify_age,
-            self.verify_contract_code,
-            self.verify_existing_bp
-        ]
-        results = [
-            check(self.balance_proof)
-            for check in checks
-        ]
-        if not (False in results):
+        with BALANCE_PROOF_STAGE_SECONDS.time(stage='validation'):
+            self.failed_check = self.validation.run(self, self.balance_proof)
+        if self.failed_check is not None:
+            log.debug('balance proof rejected by %s check', self.failed_check)
+            return False
+        with BALANCE_PROOF_STAGE_SECONDS.time(stage='store'):
             serialized_bp = self.balance_proof.serialize_data()
             self.state_db.store_balance_proof(serialized_bp)
-        return not (False in results)
+        return True
 
     def verify_contract_code(self, balance_proof):
+        if self.contract_cache is not None:
+            return self.contract_cache.has_code(balance_proof.contract_address)
         return self.web3.eth.getCode(balance_proof.contract_address) != HexBytes('0x')
 
-    @staticmethod
-    def verify_age(balance_proof):
+    def verify_age(self, balance_proof):
         bp_age = time.time() - balance_proof.timestamp
         if bp_age > MAX_BALANCE_PROOF_AGE:
-            log.info('Not accepting BP: too old. diff=%d bp=%s' % (bp_age, balance_proof))
+            log.info('Not accepting BP: too old. diff=%d bp=%s', bp_age, balance_proof)
             return False
 
         if bp_age < 0:
-            log.info('Not accepting BP: time mismatch. bp=%s' % balance_proof)
+            log.info('Not accepting BP: time mismatch. bp=%s', balance_proof)
             return False
         return True
 
@@ -62,7 +79,20 @@ class StoreBalanceProof(gevent.Greenlet):
         if existing_bp is None:
             return True
         if existing_bp['timestamp'] > balance_proof.timestamp:
-            log.warning('attempt to update with an older BP: stored=%s, received=%s' %
-                        (existing_bp, balance_proof))
+            log.warning('attempt to update with an older BP: stored=%s, received=%s',
+                        existing_bp, balance_proof)
             return False
         return True
+
+
+StoreBalanceProof.validation.register('age', COST_LOCAL, StoreBalanceProof.verify_age)
+StoreBalanceProof.validation.register(
+    'existing_bp',
+    COST_STATE,
+    StoreBalanceProof.verify_existing_bp
+)
+StoreBalanceProof.validation.register(
+    'contract_code',
+    COST_RPC,
+    StoreBalanceProof.verify_contract_code
+)
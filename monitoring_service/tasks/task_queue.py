@@ -0,0 +1,102 @@
+import logging
+import gevent
+import gevent.queue
+from monitoring_service.metrics import Counter, Gauge
+
+log = logging.getLogger(__name__)
+
+TASK_QUEUE_DEPTH = Gauge(
+    'monitoring_service_task_queue_depth',
+    'Tasks waiting for a worker',
+    ['queue']
+)
+TASKS = Counter(
+    'monitoring_service_tasks_total',
+    'Finished tasks, by result',
+    ['queue', 'result']
+)
+
+
+class TaskQueue:
+    """Run task greenlets in a fixed number of workers, fed by a bounded queue.
+
+    `put` blocks while `maxsize` tasks are waiting, which slows down the producer
+    (e.g. the transport delivering messages) instead of spawning greenlets without
+    bound. Each worker starts one task at a time and reaps it as soon as it is done.
+
+    The outcome of each task is counted. A task that runs several others, such as a
+    `BalanceProofCoalescer` channel task, is put with `counted=False` and counts the
+    tasks it runs with `count_outcome` instead.
+
+    Parameters:
+        workers: number of tasks running at once
+        maxsize: maximum number of waiting tasks
+        name: `queue` label of the queue's metrics
+    """
+    def __init__(self, workers: int = 10, maxsize: int = 1000, name: str = 'tasks') -> None:
+        assert workers > 0
+        assert maxsize > 0
+        self.name = name
+        self.worker_count = workers
+        self.queue = gevent.queue.JoinableQueue(maxsize)
+        self.workers: list = []
+        # task outcomes: True/False result, or an exception
+        self.succeeded_count = 0
+        self.rejected_count = 0
+        self.failed_count = 0
+
+    def start(self) -> None:
+        """Start the workers. While they run, the queue depth is exposed by the
+        `TASK_QUEUE_DEPTH` gauge, replacing an earlier queue of the same name"""
+        assert len(self.workers) == 0
+        TASK_QUEUE_DEPTH.set_function(self.queue.qsize, queue=self.name)
+        self.workers = [gevent.spawn(self.work) for _ in range(self.worker_count)]
+
+    def stop(self) -> None:
+        gevent.killall(self.workers)
+        self.workers = []
+        TASK_QUEUE_DEPTH.remove_function(self.queue.qsize, queue=self.name)
+
+    def put(self, task: gevent.Greenlet, timeout: float = None, counted: bool = True) -> None:
+        """Queue a task that was not started yet. Blocks while the queue is full,
+        and raises gevent.queue.Full if it still is after `timeout` seconds"""
+        self.queue.put((task, counted), timeout=timeout)
+
+    def count_outcome(self, task: gevent.Greenlet) -> None:
+        """Count the outcome of a finished task"""
+        if task.exception is not None:
+            self.failed_count += 1
+            TASKS.inc(queue=self.name, result='failed')
+        elif task.value is False:
+            self.rejected_count += 1
+            TASKS.inc(queue=self.name, result='rejected')
+        else:
+            self.succeeded_count += 1
+            TASKS.inc(queue=self.name, result='succeeded')
+
+    def work(self):
+        while True:
+            task, counted = self.queue.get()
+            try:
+                task.start()
+                task.join()
+                if counted:
+                    self.count_outcome(task)
+            finally:
+                self.queue.task_done()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait until all queued tasks are done"""
+        return self.queue.join(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'succeeded': self.succeeded_count,
+            'rejected': self.rejected_count,
+            'failed': self.failed_count
+        }
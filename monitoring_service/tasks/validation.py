@@ -0,0 +1,65 @@
+import time
+import logging
+from monitoring_service.metrics import Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+# cost classes of checks, cheapest first
+COST_LOCAL = 0      # computation on the message only
+COST_STATE = 1      # lookup in the in-memory state
+COST_RPC = 2        # Ethereum node round trip
+
+VALIDATION_CHECKS = Counter(
+    'monitoring_service_validation_checks_total',
+    'Validation checks run, by pipeline, check and result',
+    ['pipeline', 'check', 'result']
+)
+VALIDATION_CHECK_SECONDS = Histogram(
+    'monitoring_service_validation_check_seconds',
+    'Time spent in validation checks, by pipeline and check',
+    ['pipeline', 'check']
+)
+
+
+class ValidationPipeline:
+    """Ordered list of checks, each returning True if the validated object passes.
+
+    Checks are registered with a cost class and run cheapest first (in registration
+    order within a class). `run` stops at the first failing check, so expensive
+    checks are skipped for objects a cheap one already rejected. Every run check is
+    counted and timed in `VALIDATION_CHECKS` and `VALIDATION_CHECK_SECONDS`.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # (cost, registration number, check name, function)
+        self.checks: list = []
+
+    def register(self, name: str, cost: int, check) -> None:
+        assert name not in self.names
+        self.checks.append((cost, len(self.checks), name, check))
+        self.checks.sort(key=lambda x: x[:2])
+
+    @property
+    def names(self) -> list:
+        return [x[2] for x in self.checks]
+
+    def run(self, *args):
+        """Run checks with `args`. Returns the name of the failed check, or None"""
+        for _, _, name, check in self.checks:
+            start = time.monotonic()
+            try:
+                result = check(*args)
+            except Exception:
+                VALIDATION_CHECKS.inc(pipeline=self.name, check=name, result='error')
+                raise
+            finally:
+                VALIDATION_CHECK_SECONDS.observe(
+                    time.monotonic() - start,
+                    pipeline=self.name,
+                    check=name
+                )
+            if result is False:
+                VALIDATION_CHECKS.inc(pipeline=self.name, check=name, result='rejected')
+                return name
+            VALIDATION_CHECKS.inc(pipeline=self.name, check=name, result='passed')
+        return None
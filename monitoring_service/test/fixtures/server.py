@@ -17,8 +17,8 @@ def dummy_transport():
 
 
 @pytest.fixture
-def blockchain(web3):
-    blockchain = BlockchainMonitor(web3)
+def blockchain(web3, state_db):
+    blockchain = BlockchainMonitor(web3, state_db=state_db)
     blockchain.poll_interval = 1
     return blockchain
 
@@ -37,4 +37,6 @@ def monitoring_service(server_private_key, blockchain, dummy_transport, state_db
 def rest_api(monitoring_service, blockchain, rest_host, rest_port):
     api = ServiceApi(monitoring_service, blockchain)
     api.run(rest_host, rest_port)
-    return api
+    yield api
+    # free the port, so the next test does not talk to this test's state DB
+    api.stop()
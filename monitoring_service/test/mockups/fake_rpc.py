@@ -0,0 +1,50 @@
+import json
+import gevent
+from gevent.pywsgi import WSGIServer
+
+
+class FakeRPCServer:
+    """A local JSON-RPC server with a fixed latency per HTTP request.
+
+    Handles single and batch requests. `handlers` maps method names to functions
+    called with the request params. Counts HTTP requests and RPC calls, so tests can
+    compare round trips with and without batching.
+    """
+    def __init__(self, handlers: dict, latency: float = 0.05, host: str = 'localhost'):
+        self.handlers = handlers
+        self.latency = latency
+        self.http_requests = 0
+        self.rpc_calls = 0
+        self.server = WSGIServer((host, 0), self.application, log=None)
+
+    @property
+    def endpoint_uri(self):
+        return 'http://%s:%d' % (self.server.server_host, self.server.server_port)
+
+    def handle_call(self, request: dict) -> dict:
+        self.rpc_calls += 1
+        handler = self.handlers.get(request['method'], None)
+        if handler is None:
+            return {
+                'jsonrpc': '2.0',
+                'id': request['id'],
+                'error': {'code': -32601, 'message': 'Method not found'}
+            }
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': handler(*request['params'])}
+
+    def application(self, environ, start_response):
+        self.http_requests += 1
+        gevent.sleep(self.latency)
+        body = json.loads(environ['wsgi.input'].read().decode())
+        if isinstance(body, list):
+            response = [self.handle_call(x) for x in body]
+        else:
+            response = self.handle_call(body)
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [json.dumps(response).encode()]
+
+    def start(self):
+        self.server.start()
+
+    def stop(self):
+        self.server.stop()
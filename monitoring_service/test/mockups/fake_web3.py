@@ -0,0 +1,49 @@
+from hexbytes import HexBytes
+
+
+class FakeEth:
+    """eth namespace of a fake chain, for unit tests that do not need a node.
+
+    Blocks up to `blockNumber` exist; their hashes change after `reorg`. Contract code
+    is looked up in `code` (address -> hex code). `getLogs` returns `logs_per_block`
+    empty logs per block and rejects ranges of more than `max_range` blocks.
+    Requests are counted, or recorded as (fromBlock, toBlock) for `getLogs`.
+    """
+    def __init__(self, block_number=0, code=None, logs_per_block=0, max_range=None):
+        self.blockNumber = block_number
+        self.fork = 0
+        # block number -> fork of the block
+        self.forked_at = {}
+        self.code = {} if code is None else code
+        self.logs_per_block = logs_per_block
+        self.max_range = max_range
+        self.block_requests = 0
+        self.code_requests = 0
+        self.log_requests = []
+
+    def reorg(self, from_block):
+        self.fork += 1
+        for n in range(from_block, self.blockNumber + 1):
+            self.forked_at[n] = self.fork
+
+    def getBlock(self, n):
+        self.block_requests += 1
+        if n > self.blockNumber:
+            return None
+        return {'hash': bytes([self.forked_at.get(n, 0)]) + n.to_bytes(31, 'big')}
+
+    def getCode(self, address):
+        self.code_requests += 1
+        return HexBytes(self.code.get(address, '0x'))
+
+    def getLogs(self, params):
+        self.log_requests.append((params['fromBlock'], params['toBlock']))
+        block_count = params['toBlock'] - params['fromBlock'] + 1
+        if self.max_range is not None and block_count > self.max_range:
+            raise ValueError('query returned more than 10000 results')
+        return [{} for _ in range(block_count * self.logs_per_block)]
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
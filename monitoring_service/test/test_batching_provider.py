@@ -0,0 +1,54 @@
+import gevent
+import pytest
+from web3 import Web3
+
+from monitoring_service.batching_provider import BatchingHTTPProvider
+from monitoring_service.test.mockups.fake_rpc import FakeRPCServer
+
+LATENCY = 0.05
+
+
+@pytest.fixture
+def fake_rpc():
+    server = FakeRPCServer({
+        'eth_getCode': lambda address, block: '0x' + address[2:6],
+        'eth_blockNumber': lambda: '0x10',
+    }, latency=LATENCY)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_batching_provider(fake_rpc):
+    """concurrent calls share one HTTP round trip, each caller gets its own result"""
+    provider = BatchingHTTPProvider(fake_rpc.endpoint_uri, batch_window=0.01)
+    addresses = ['0x%040x' % (0x1000 + i) for i in range(50)]
+
+    jobs = [
+        gevent.spawn(provider.make_request, 'eth_getCode', [address, 'latest'])
+        for address in addresses
+    ]
+    gevent.joinall(jobs, raise_error=True)
+
+    assert [x.value['result'] for x in jobs] == ['0x' + x[2:6] for x in addresses]
+    assert fake_rpc.http_requests == 1
+    assert fake_rpc.rpc_calls == len(addresses)
+    assert provider.batch_count == 1
+
+    # methods that are not batched go out right away
+    assert provider.make_request('eth_blockNumber', [])['result'] == '0x10'
+    assert fake_rpc.http_requests == 2
+
+
+def test_batching_provider_web3(fake_rpc):
+    """results pass through web3 formatters unchanged"""
+    provider = BatchingHTTPProvider(fake_rpc.endpoint_uri, max_batch_size=2)
+    web3 = Web3(provider)
+    jobs = [
+        gevent.spawn(web3.eth.getCode, web3.toChecksumAddress('0x%040x' % (0xabcd0000 + i)))
+        for i in range(4)
+    ]
+    gevent.joinall(jobs, raise_error=True)
+    assert fake_rpc.http_requests == 2
+    assert provider.batch_count == 2
+    assert all(x.value is not None for x in jobs)
@@ -1,4 +1,6 @@
+import gevent
 import requests
+from raiden_libs.messages import Message
 
 
 def test_rest_api(monitoring_service, rest_api, generate_raiden_client):
@@ -11,3 +13,86 @@ def test_rest_api(monitoring_service, rest_api, generate_raiden_client):
     monitoring_service.transport.send_message(msg)
     ret = requests.get('http://localhost:5001/api/1/balance_proofs')
     assert len([x for x in ret.json() if x['channel_id'] == channel_id]) == 1
+
+
+def test_rest_api_post_balance_proofs(monitoring_service, rest_api, generate_raiden_client):
+    c1, c2, c3 = generate_raiden_client(), generate_raiden_client(), generate_raiden_client()
+    channel_ids = [c1.open_channel(c2.address), c1.open_channel(c3.address)]
+    batch = [
+        c1.get_balance_proof(c2.address, transferred_amount=1, nonce=1).serialize_full(c1.privkey),
+        '{"not": "a balance proof"}',
+        c1.get_balance_proof(c3.address, transferred_amount=1, nonce=1).serialize_full(c1.privkey)
+    ]
+    ret = requests.post(
+        'http://localhost:5001/api/1/balance_proofs',
+        data='\n'.join(batch),
+        params={'wait': 10},
+        headers={'Content-Type': 'application/x-ndjson'}
+    )
+    assert ret.status_code == 200
+    assert [x['status'] for x in ret.json()] == ['stored', 'invalid', 'stored']
+    assert sorted(monitoring_service.state_db.balance_proofs) == sorted(channel_ids)
+
+    ret = requests.post('http://localhost:5001/api/1/balance_proofs', json={'a': 1})
+    assert ret.status_code == 400
+    ret = requests.post('http://localhost:5001/api/1/balance_proofs', json=[], params={'wait': 61})
+    assert ret.status_code == 400
+
+
+def test_rest_api_post_yields(monitoring_service, rest_api, monkeypatch):
+    """a large POST does not stop other greenlets while its messages are decoded"""
+    decoded = []
+
+    def deserialize(json_msg):
+        decoded.append(json_msg)
+        return json_msg
+
+    progress = []
+
+    def watch():
+        while True:
+            progress.append(len(decoded))
+            gevent.sleep(0)
+
+    monkeypatch.setattr(Message, 'deserialize', staticmethod(deserialize))
+    watcher = gevent.spawn(watch)
+    batch = ['{"message_type": "BalanceProof", "n": %d}' % i for i in range(1000)]
+    ret = requests.post('http://localhost:5001/api/1/balance_proofs', json=batch)
+    watcher.kill()
+    assert ret.status_code == 200
+    assert len(decoded) == len(batch)
+    # the watcher saw the decoding half done
+    assert any(0 < x < len(batch) for x in progress)
+
+
+def test_rest_api_get_pages(monitoring_service, rest_api, get_random_bp):
+    bps = [get_random_bp().serialize_data() for _ in range(3)]
+    [monitoring_service.state_db.store_balance_proof(bp) for bp in bps]
+    channel_ids = sorted(x['channel_id'] for x in bps)
+
+    url = 'http://localhost:5001/api/1/balance_proofs'
+    ret = requests.get(url, params={'limit': 2})
+    assert [x['channel_id'] for x in ret.json()] == channel_ids[:2]
+    ret = requests.get(url, params={'limit': 2, 'cursor': ret.headers['X-Next-Cursor']})
+    assert [x['channel_id'] for x in ret.json()] == channel_ids[2:]
+    assert 'X-Next-Cursor' not in ret.headers
+
+    ret = requests.get(url, params={'participant': bps[0]['participant1']})
+    assert [x['channel_id'] for x in ret.json()] == [bps[0]['channel_id']]
+    # addresses match in any spelling
+    ret = requests.get(url, params={'participant': bps[0]['participant1'].lower()})
+    assert [x['channel_id'] for x in ret.json()] == [bps[0]['channel_id']]
+    ret = requests.get(url, params={'contract_address': bps[0]['contract_address'].lower()})
+    assert bps[0]['channel_id'] in [x['channel_id'] for x in ret.json()]
+    assert requests.get(url, params={'participant': '0x1234'}).status_code == 400
+
+    etag = requests.get(url).headers['ETag']
+    assert requests.get(url, headers={'If-None-Match': etag}).status_code == 304
+    monitoring_service.state_db.delete_balance_proof(bps[0]['channel_id'])
+    assert requests.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_rest_api_metrics(monitoring_service, rest_api):
+    ret = requests.get('http://localhost:5001/metrics')
+    assert ret.headers['Content-Type'].startswith('text/plain')
+    assert '# TYPE monitoring_service_messages_received_total counter' in ret.text
@@ -1,3 +1,12 @@
+import sqlite3
+import gevent
+import pytest
+
+from monitoring_service.state_db import StateDB
+from monitoring_service.state_db.migrations import get_schema_version
+from monitoring_service.state_db.queries import SCHEMA_VERSION
+
+
 def test_state_db(state_db, get_random_bp):
     bp = get_random_bp()
     bp = bp.serialize_data()
@@ -16,3 +25,189 @@ def test_state_db(state_db, get_random_bp):
     ]
     for x in fields_to_check:
         assert bp[x] == ret[bp['channel_id']][x]
+
+
+def test_state_db_index(state_db, get_random_bp):
+    """in-memory index must follow stores and deletes"""
+    bp = get_random_bp().serialize_data()
+    state_db.store_balance_proof(bp)
+    assert state_db.get_balance_proof(bp['channel_id'])['nonce'] == bp['nonce']
+    assert bp['channel_id'] in state_db.balance_proofs
+
+    state_db.delete_balance_proof(bp['channel_id'])
+    assert bp['channel_id'] not in state_db.balance_proofs
+    assert state_db.get_balance_proof(bp['channel_id']) is None
+
+
+V1_SCHEMA_SQL = """
+CREATE TABLE `metadata` (
+    `network_id`       INTEGER,
+    `contract_address` CHAR(42),
+    `receiver`         CHAR(42)
+);
+CREATE TABLE `syncstate` (
+    `confirmed_head_number`   INTEGER,
+    `confirmed_head_hash`     CHAR(66),
+    `unconfirmed_head_number` INTEGER,
+    `unconfirmed_head_hash`   CHAR(66)
+);
+CREATE TABLE `balance_proofs` (
+    `channel_id`        CHAR(34)    NOT NULL,
+    `contract_address`  CHAR(42)    NOT NULL,
+    `participant1`      CHAR(42)    NOT NULL,
+    `participant2`      CHAR(42)    NOT NULL,
+    `nonce`             CHAR(34)    NOT NULL,
+    `transferred_amount` CHAR(34)   NOT NULL,
+    `extra_hash`        CHAR(32)    NOT NULL,
+    `signature`         CHAR(160)   NOT NULL,
+    `timestamp`         INT         NOT NULL,
+    `chain_id`          INT         NOT NULL
+);
+INSERT INTO `metadata` VALUES (NULL, NULL, NULL);
+INSERT INTO `syncstate` VALUES (NULL, NULL, NULL, NULL);
+"""
+
+
+def test_state_db_migration(tmpdir, get_random_bp):
+    """v1 databases (hex columns, duplicate rows) are upgraded when opened"""
+    filename = str(tmpdir.join('state.db'))
+    conn = sqlite3.connect(filename)
+    conn.executescript(V1_SCHEMA_SQL)
+    bp = get_random_bp().serialize_data()
+    for nonce, timestamp in ((1, 100), (2, 200)):
+        conn.execute('INSERT INTO `balance_proofs` VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            hex(bp['channel_id']),
+            bp['contract_address'],
+            bp['participant1'],
+            bp['participant2'],
+            hex(nonce),
+            hex(bp['transferred_amount']),
+            bp['extra_hash'],
+            bp['signature'],
+            timestamp,
+            bp['chain_id']
+        ])
+    conn.commit()
+    conn.close()
+
+    state_db = StateDB(filename)
+    assert get_schema_version(state_db.conn) == SCHEMA_VERSION
+    stored = state_db.balance_proofs[bp['channel_id']]
+    assert stored['nonce'] == 2
+    assert stored['participant1'] == bp['participant1']
+    assert stored['signature'] == bp['signature']
+    count = state_db.conn.execute('SELECT COUNT(*) AS c FROM `balance_proofs`').fetchone()
+    assert count['c'] == 1
+
+
+def test_state_db_group_commit(tmpdir, get_random_address, get_random_bp):
+    """writes queued together are committed in one transaction and survive a reopen"""
+    filename = str(tmpdir.join('state.db'))
+    state_db = StateDB(filename, max_latency=0.1)
+    state_db.setup_db(0, get_random_address(), get_random_address())
+    bps = [get_random_bp().serialize_data() for _ in range(10)]
+    results = [state_db.store_balance_proof(bp) for bp in bps]
+    results.append(state_db.delete_balance_proof(bps[0]['channel_id']))
+    gevent.joinall(results, timeout=5, raise_error=True)
+    assert all(x.get() is True for x in results)
+    assert state_db.writer.commit_count == 1
+    state_db.close()
+
+    state_db = StateDB(filename)
+    assert set(state_db.balance_proofs.keys()) == set(x['channel_id'] for x in bps[1:])
+    assert state_db.conn.execute('PRAGMA journal_mode').fetchone()['journal_mode'] == 'wal'
+
+
+def test_state_db_commit_failure(state_db, get_random_bp):
+    """a failed commit stops the writer, later writes fail instead of being lost"""
+    failed = state_db.writer.submit('INSERT INTO `missing_table` VALUES (1)', [])
+    with pytest.raises(sqlite3.OperationalError):
+        failed.get(timeout=5)
+    state_db.writer.join(timeout=5)
+    assert state_db.writer.dead
+    assert isinstance(state_db.writer.exception, sqlite3.OperationalError)
+    result = state_db.store_balance_proof(get_random_bp().serialize_data())
+    with pytest.raises(sqlite3.OperationalError):
+        result.get(timeout=5)
+    assert state_db.flush(timeout=5) is False
+
+
+def test_state_db_threadpool(tmpdir, get_random_address, get_random_bp):
+    """threadpool mode keeps the same API"""
+    # characters with a meaning in URIs, read connections open the file by URI
+    filename = str(tmpdir.join('state #1?%.db'))
+    state_db = StateDB(filename, read_threads=2)
+    state_db.setup_db(0, get_random_address(), get_random_address())
+    bp = get_random_bp().serialize_data()
+    assert state_db.store_balance_proof(bp).get(timeout=5) is True
+    state_db.close()
+
+    state_db = StateDB(filename, read_threads=2)
+    assert state_db.balance_proofs[bp['channel_id']]['signature'] == bp['signature']
+    state_db.delete_balance_proof(bp['channel_id'])
+    assert state_db.flush(timeout=5)
+    state_db.close()
+    assert bp['channel_id'] not in StateDB(filename).balance_proofs
+
+
+def test_state_db_metadata(state_db):
+    metadata = state_db.metadata
+    assert metadata['contract_address'] is not None
+    assert metadata['schema_version'] == SCHEMA_VERSION
+
+
+def test_state_db_transport_state(tmpdir, get_random_address):
+    filename = str(tmpdir.join('state.db'))
+    state_db = StateDB(filename)
+    state_db.setup_db(0, get_random_address(), get_random_address())
+    assert state_db.get_transport_state('token') is None
+    state_db.set_transport_state('token', 's1')
+    state_db.set_transport_state('token', 's2')
+    state_db.close()
+    assert StateDB(filename).get_transport_state('token') == 's2'
+
+
+def test_state_db_query(state_db, get_random_bp):
+    bps = [get_random_bp().serialize_data() for _ in range(5)]
+    version = state_db.version
+    [state_db.store_balance_proof(bp) for bp in bps]
+    assert state_db.version == version + 5
+    channel_ids = sorted(x['channel_id'] for x in bps)
+
+    page = state_db.query_balance_proofs(limit=3)
+    assert [x['channel_id'] for x in page] == channel_ids[:3]
+    page = state_db.query_balance_proofs(after=page[-1]['channel_id'], limit=3)
+    assert [x['channel_id'] for x in page] == channel_ids[3:]
+
+    bp = bps[2]
+    assert state_db.query_balance_proofs(participant=bp['participant2']) == [
+        state_db.balance_proofs[bp['channel_id']]
+    ]
+    assert len(state_db.query_balance_proofs(contract_address=bp['contract_address'])) >= 1
+    assert len(state_db.query_balance_proofs(max_timestamp=bp['timestamp'] - 1)) < 5
+
+    state_db.delete_balance_proof(bp['channel_id'])
+    assert state_db.version == version + 6
+    assert bp['channel_id'] not in [x['channel_id'] for x in state_db.query_balance_proofs()]
+
+
+def test_state_db_changes(tmpdir, get_random_address, get_random_bp):
+    state_db = StateDB(str(tmpdir.join('state.db')), change_log_size=3)
+    state_db.setup_db(0, get_random_address(), get_random_address())
+    start = state_db.version
+    bps = [get_random_bp().serialize_data() for _ in range(2)]
+    [state_db.store_balance_proof(bp) for bp in bps]
+    state_db.store_balance_proof(bps[0])
+    assert state_db.changes_since(start) == [
+        (start + 2, bps[1]['channel_id']),
+        (start + 3, bps[0]['channel_id'])
+    ]
+    assert state_db.changes_since(start + 3) == []
+    assert state_db.changes_since(start + 4) is None
+    state_db.delete_balance_proof(bps[1]['channel_id'])
+    # the first change fell out of the log
+    assert state_db.changes_since(start) is None
+    assert state_db.changes_since(start + 2) == [
+        (start + 3, bps[0]['channel_id']),
+        (start + 4, bps[1]['channel_id'])
+    ]
@@ -4,6 +4,7 @@ from monitoring_service.constants import (
     EVENT_CHANNEL_SETTLED,
     EVENT_TRANSFER_UPDATED
 )
+from monitoring_service.blockchain import BlockchainMonitor
 from raiden_contracts.contract_manager import CONTRACT_MANAGER
 from raiden_libs.utils import make_filter
 
@@ -33,8 +34,9 @@ def test_blockchain(generate_raiden_client, blockchain, wait_for_blocks):
         EVENT_TRANSFER_UPDATED,
         lambda ev, tx: t.trigger()
     )
-    blockchain.event_filters = blockchain.make_filters()
     blockchain.poll_interval = 0
+    # start scanning from the current block
+    blockchain.poll_blockchain()
 
     c1 = generate_raiden_client()
     c2 = generate_raiden_client()
@@ -86,3 +88,27 @@ def test_filter(generate_raiden_client, web3):
         (x['address'] == c1.contract.address)
     ]) == 1
     assert len(f.get_all_entries()) > 0
+
+
+def test_blockchain_resume(generate_raiden_client, blockchain, state_db, wait_for_blocks):
+    """progress is kept in syncstate and a new monitor continues from there"""
+    t = Trigger()
+    blockchain.register_handler(EVENT_CHANNEL_CLOSE, lambda ev, tx: t.trigger())
+    blockchain.poll_interval = 0
+    blockchain.poll_blockchain()
+    assert state_db.sync_state['confirmed_head_number'] == blockchain.last_block
+
+    c1 = generate_raiden_client()
+    c2 = generate_raiden_client()
+    c1.open_channel(c2.address)
+    bp = c2.get_balance_proof(c1.address, transferred_amount=1, nonce=1)
+    c1.close_channel(c2.address, bp)
+    wait_for_blocks(1)
+
+    # a restarted monitor must pick up the close that happened while it was down
+    restarted = BlockchainMonitor(blockchain.web3, state_db=state_db)
+    restarted.register_handler(EVENT_CHANNEL_CLOSE, lambda ev, tx: t.trigger())
+    restarted.poll_interval = 0
+    restarted.poll_blockchain()
+    assert t.trigger_count == 1
+    assert state_db.sync_state['confirmed_head_number'] == blockchain.web3.eth.blockNumber
@@ -0,0 +1,74 @@
+from monitoring_service.cache import LRUCache, TTLCache, RecentSet
+from monitoring_service.contract_cache import ContractCodeCache
+from monitoring_service.test.mockups.fake_web3 import FakeEth, FakeWeb3
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used entry
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache():
+    clock = Clock()
+    cache = TTLCache(clock=clock)
+    cache.set('a', 1, ttl=10)
+    cache['b'] = 2
+    clock.now = 9
+    assert cache.get('a') == 1
+    clock.now = 10
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    assert cache.get('b') == 2
+
+
+def test_contract_code_cache():
+    """contracts are looked up once, missing code is looked up again after negative_ttl"""
+    eth = FakeEth(code={'0x01': '0x6060'})
+    cache = ContractCodeCache(FakeWeb3(eth), negative_ttl=10)
+    clock = Clock()
+    cache.cache.clock = clock
+    cache.warm(['0x01'])
+    assert cache.has_code('0x01') is True
+    assert cache.has_code('0x01') is True
+    assert eth.code_requests == 1
+
+    assert cache.has_code('0x02') is False
+    eth.code['0x02'] = '0x6060'
+    assert cache.has_code('0x02') is False
+    assert eth.code_requests == 2
+    clock.now = 10
+    assert cache.has_code('0x02') is True
+    assert eth.code_requests == 3
+
+
+def test_recent_set():
+    recent = RecentSet(4)
+    assert recent.add('a') is True
+    assert recent.add('a') is False
+    recent.add('b')
+    recent.add('c')
+    assert 'a' in recent
+    recent.add('d')
+    recent.add('e')
+    # the generation holding 'a' and 'b' was dropped
+    assert 'a' not in recent
+    assert 'c' in recent and 'e' in recent
+    assert len(recent) == 3
@@ -0,0 +1,23 @@
+from eth_abi import encode_abi
+from eth_utils import encode_hex, function_abi_to_4byte_selector
+
+from monitoring_service.call_decoder import CallDecoder
+
+SET_ABI = {
+    'type': 'function',
+    'name': 'set',
+    'inputs': [{'name': 'key', 'type': 'uint256'}, {'name': 'value', 'type': 'address'}],
+    'outputs': []
+}
+
+
+def test_call_decoder():
+    decoder = CallDecoder([SET_ABI, {'type': 'event', 'name': 'Set', 'inputs': []}])
+    value = '0x' + '11' * 20
+    data = function_abi_to_4byte_selector(SET_ABI) + encode_abi(['uint256', 'address'], [5, value])
+    name, args = decoder.decode(encode_hex(data))
+    assert name == 'set'
+    assert args[0] == 5
+    assert args[1].lower() == value
+
+    assert decoder.decode('0x12345678') is None
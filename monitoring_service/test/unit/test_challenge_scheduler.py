@@ -0,0 +1,55 @@
+import gevent
+from monitoring_service.challenge_scheduler import ChallengeScheduler
+
+
+def test_challenge_order():
+    """channels are challenged in order of their settlement deadline"""
+    challenged = []
+    scheduler = ChallengeScheduler(challenged.append, settle_timeout=10, workers=1)
+    scheduler.schedule(1, close_block=30)
+    scheduler.schedule(2, close_block=10)
+    scheduler.schedule(3, close_block=20)
+    scheduler.schedule(4, close_block=5)
+    scheduler.cancel(3)
+    scheduler.start()
+    assert scheduler.join_challenges(timeout=1)
+    assert challenged == [4, 2, 1]
+    scheduler.kill()
+
+
+def test_challenge_urgent_first():
+    """a channel scheduled while workers are busy goes before less urgent ones"""
+    challenged = []
+
+    def challenge(channel_id):
+        gevent.sleep(0.01)
+        challenged.append(channel_id)
+
+    scheduler = ChallengeScheduler(challenge, settle_timeout=10, workers=2)
+    scheduler.start()
+    for channel_id in range(1, 11):
+        scheduler.schedule(channel_id, close_block=100 + channel_id)
+    gevent.sleep(0)
+    scheduler.schedule(11, close_block=1)
+    assert scheduler.join_challenges(timeout=1)
+    assert challenged.index(11) < 4
+    assert challenged[-1] == 10
+    assert scheduler.challenged_count == 11
+    scheduler.kill()
+
+
+def test_challenge_missed_deadline():
+    """channels whose deadline has passed are not challenged"""
+    challenged = []
+    scheduler = ChallengeScheduler(
+        challenged.append,
+        settle_timeout=10,
+        block_number=lambda: 25
+    )
+    scheduler.schedule(1, close_block=10)
+    scheduler.schedule(2, close_block=20)
+    scheduler.start()
+    assert scheduler.join_challenges(timeout=1)
+    assert challenged == [2]
+    assert scheduler.missed_count == 1
+    scheduler.kill()
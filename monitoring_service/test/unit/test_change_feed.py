@@ -0,0 +1,63 @@
+import json
+import gevent
+import pytest
+from monitoring_service.api.change_feed import ChangeFeed, parse_version
+from monitoring_service.api.response_cache import ResponseCache
+
+
+class StateDB:
+    def __init__(self):
+        self.balance_proofs = {}
+        self.change_listeners = []
+        self.changes = []
+        self.epoch = 'e1'
+        self.version = 0
+
+    def add_change_listener(self, callback):
+        self.change_listeners.append(callback)
+
+    def store(self, channel_id, nonce):
+        self.version += 1
+        if nonce is None:
+            self.balance_proofs.pop(channel_id)
+        else:
+            self.balance_proofs[channel_id] = {'channel_id': channel_id, 'nonce': nonce}
+        self.changes.append((self.version, channel_id))
+        [x(channel_id) for x in self.change_listeners]
+
+    def get_balance_proof(self, channel_id):
+        return self.balance_proofs.get(channel_id, None)
+
+    def changes_since(self, seq):
+        return [x for x in self.changes if x[0] > seq]
+
+
+def test_change_feed():
+    state_db = StateDB()
+    feed = ChangeFeed(state_db, ResponseCache(state_db))
+    state_db.store(1, 1)
+    state_db.store(2, 1)
+    changes = json.loads(feed.get_changes('e1-1').decode())
+    assert changes == {
+        'version': 'e1-2',
+        'changes': [
+            {'version': 'e1-2', 'channel_id': 2, 'balance_proof': {'channel_id': 2, 'nonce': 1}}
+        ]
+    }
+
+    stream = feed.stream('e1-1')
+    assert next(stream).startswith(b'id: e1-2\n')
+    gevent.spawn_later(0.01, state_db.store, 1, None)
+    assert next(stream) == \
+        b'id: e1-3\ndata: {"version":"e1-3","channel_id":1,"balance_proof":null}\n\n'
+
+
+def test_change_feed_restart():
+    """versions of an earlier run are not resumed, their sequence numbers start over"""
+    state_db = StateDB()
+    feed = ChangeFeed(state_db, ResponseCache(state_db))
+    state_db.store(1, 1)
+    assert feed.get_changes('e0-0') is None
+    assert list(feed.stream('e0-0')) == [b'event: reset\ndata: e1-1\n\n']
+    with pytest.raises(ValueError):
+        parse_version('12')
@@ -0,0 +1,79 @@
+import gevent
+from monitoring_service.tasks import TaskQueue, BalanceProofCoalescer
+
+
+class BalanceProof:
+    def __init__(self, channel_id, nonce, timestamp=0):
+        self.channel_id = channel_id
+        self.nonce = nonce
+        self.timestamp = timestamp
+
+
+def test_coalescer():
+    """only the newest waiting balance proof of a channel is validated"""
+    validated = []
+
+    def validate(balance_proof):
+        gevent.sleep(0.01)
+        validated.append((balance_proof.channel_id, balance_proof.nonce))
+        return True
+
+    tasks = TaskQueue(workers=2)
+    coalescer = BalanceProofCoalescer(tasks, lambda bp: gevent.Greenlet(validate, bp))
+    tasks.start()
+    coalescer.submit(BalanceProof(1, 1))
+    gevent.sleep(0.001)
+    # channel 1 is being validated, these wait for it
+    replaced = coalescer.submit(BalanceProof(1, 3))
+    older = coalescer.submit(BalanceProof(1, 2))
+    newest = coalescer.submit(BalanceProof(1, 3, timestamp=1))
+    coalescer.submit(BalanceProof(2, 5))
+    assert older.get(block=False) is None
+    assert tasks.join(timeout=1)
+    assert replaced.get(block=False) is None
+    assert newest.get(block=False).value is True
+    assert sorted(validated) == [(1, 1), (1, 3), (2, 5)]
+    assert coalescer.coalesced_count == 2
+    assert coalescer.active == set()
+    # outcomes are counted per validated proof, not per channel task
+    assert tasks.succeeded_count == 3
+    tasks.stop()
+
+
+def test_coalescer_task_failure():
+    """a failed task does not leave the channel's waiting proof behind"""
+    validated = []
+
+    def validate(balance_proof):
+        gevent.sleep(0.01)
+        if balance_proof.nonce == 1 and balance_proof.timestamp == 0:
+            raise ValueError('RPC failed')
+        validated.append(balance_proof.nonce)
+        return True
+
+    def make_task(balance_proof):
+        if balance_proof.channel_id == 2 and balance_proof.nonce == 2:
+            raise RuntimeError('no task')
+        return gevent.Greenlet(validate, balance_proof)
+
+    tasks = TaskQueue(workers=1)
+    coalescer = BalanceProofCoalescer(tasks, make_task)
+    tasks.start()
+    failed = coalescer.submit(BalanceProof(1, 1))
+    gevent.sleep(0.001)
+    waiting = coalescer.submit(BalanceProof(1, 2))
+    assert tasks.join(timeout=1)
+    assert isinstance(failed.get(block=False).exception, ValueError)
+    assert waiting.get(block=False).value is True
+    assert validated == [2]
+    assert (tasks.succeeded_count, tasks.failed_count) == (1, 1)
+
+    # the channel task itself dies
+    coalescer.submit(BalanceProof(2, 1, timestamp=1))
+    gevent.sleep(0.001)
+    waiting = coalescer.submit(BalanceProof(2, 2))
+    assert tasks.join(timeout=1)
+    assert isinstance(waiting.exception, RuntimeError)
+    assert coalescer.pending == {}
+    assert coalescer.active == set()
+    tasks.stop()
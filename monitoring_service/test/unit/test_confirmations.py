@@ -0,0 +1,123 @@
+from monitoring_service.constants import EVENT_CHANNEL_CLOSE
+from monitoring_service.blockchain import BlockchainMonitor
+from monitoring_service.test.mockups.fake_web3 import FakeEth, FakeWeb3
+
+
+class FakeScanner:
+    """returns one ChannelClosed event per block in `event_blocks`, scanning up to
+    `max_range` blocks at a time"""
+    def __init__(self, event_blocks, max_range=None):
+        self.event_blocks = event_blocks
+        self.max_range = max_range
+
+    def scan(self, from_block, to_block):
+        if self.max_range is not None:
+            to_block = min(to_block, from_block + self.max_range - 1)
+        events = [
+            {'event': EVENT_CHANNEL_CLOSE, 'blockNumber': n, 'transactionHash': '0x%02x' % n}
+            for n in self.event_blocks if from_block <= n <= to_block
+        ]
+        return events, to_block
+
+
+class Monitor(BlockchainMonitor):
+    def decode_transaction(self, tx_hash):
+        return 'closeChannel', []
+
+
+def make_monitor(chain, event_blocks, **kwargs):
+    monitor = Monitor(FakeWeb3(chain), **kwargs)
+    monitor.log_scanner = FakeScanner(event_blocks)
+    monitor.poll_interval = 0
+    dispatched = []
+    monitor.register_handler(
+        EVENT_CHANNEL_CLOSE,
+        lambda ev, tx: dispatched.append(ev['blockNumber'])
+    )
+    return monitor, dispatched
+
+
+def test_confirmations():
+    """events are dispatched once their block has enough confirmations"""
+    chain = FakeEth(10)
+    monitor, dispatched = make_monitor(chain, [12, 14], start_block=11, confirmations=3)
+    monitor.poll_blockchain()
+    assert dispatched == []
+
+    chain.blockNumber = 14
+    monitor.poll_blockchain()
+    assert dispatched == []
+    assert monitor.last_block == 14
+    assert [ev['blockNumber'] for ev in monitor.pending_events] == [12, 14]
+
+    chain.blockNumber = 15
+    monitor.poll_blockchain()
+    assert dispatched == [12]
+    assert monitor.confirmed_block == 12
+
+    chain.blockNumber = 17
+    monitor.poll_blockchain()
+    assert dispatched == [12, 14]
+    assert monitor.pending_events == []
+
+
+def test_reorg():
+    """pending events of replaced blocks are dropped and the blocks rescanned"""
+    chain = FakeEth(10)
+    monitor, dispatched = make_monitor(chain, [13], start_block=11, confirmations=5)
+    chain.blockNumber = 14
+    monitor.poll_blockchain()
+    assert len(monitor.pending_events) == 1
+
+    # blocks from 13 on are replaced, and the event moves to block 15
+    monitor.log_scanner.event_blocks = [15]
+    chain.reorg(13)
+    chain.blockNumber = 15
+    monitor.poll_blockchain()
+    assert [ev['blockNumber'] for ev in monitor.pending_events] == [15]
+
+    chain.blockNumber = 20
+    monitor.poll_blockchain()
+    assert dispatched == [15]
+
+
+class StateDB:
+    def __init__(self):
+        self.sync_state = {}
+        self.checkpoints = []
+
+    def update_sync_state(self, confirmed, confirmed_hash, unconfirmed, unconfirmed_hash):
+        self.checkpoints.append(unconfirmed)
+
+
+def test_checkpoint_interval():
+    """while catching up, block hashes are fetched only for every few ranges"""
+    chain = FakeEth(100)
+    state_db = StateDB()
+    monitor, dispatched = make_monitor(
+        chain,
+        [15, 95],
+        state_db=state_db,
+        start_block=1,
+        checkpoint_interval=4
+    )
+    monitor.log_scanner.max_range = 10
+    monitor.poll_blockchain()
+    assert dispatched == [15, 95]
+    # the initial position, every 4th of 10 ranges, and the head
+    assert state_db.checkpoints == [0, 40, 80, 100]
+    assert chain.block_requests == 5
+
+
+def test_submit_events():
+    """injected events are dispatched in order, each with its outcome"""
+    monitor, dispatched = make_monitor(FakeEth(0), [])
+    monitor.register_handler(EVENT_CHANNEL_CLOSE, lambda ev, tx: 1 / ev['args']['n'])
+    events = [
+        {'event': EVENT_CHANNEL_CLOSE, 'blockNumber': n, 'transactionHash': '0x01',
+         'args': {'n': n}}
+        for n in (2, 0, 1)
+    ]
+    events.append({'event': 'Unknown', 'blockNumber': 3, 'transactionHash': '0x01'})
+    assert monitor.submit_events(events) == ['handled', 'error', 'handled', 'unhandled']
+    assert dispatched == [2, 0, 1]
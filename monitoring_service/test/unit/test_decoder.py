@@ -0,0 +1,104 @@
+import gevent
+import pytest
+from raiden_libs.messages import Message
+from monitoring_service.transport.decoder import (
+    DecoderPool,
+    BatchDecoder,
+    decode_message,
+    decode_messages_on_hub,
+    decode_message_or_reason
+)
+
+
+def test_decode_invalid():
+    assert decode_message('not a json') is None
+    assert decode_message('{"type": "Unknown"}') is None
+    assert decode_message_or_reason('not a json') == 'json'
+    assert decode_message_or_reason('{"message_type": "FeeInfo"}', ['BalanceProof']) == 'type'
+
+
+def test_batch_decoder():
+    """messages are decoded in worker processes, invalid ones are counted and dropped"""
+    pool = DecoderPool(2)
+    decoded = []
+    decoder = BatchDecoder(pool, decoded.append, batch_size=10)
+    decoder.start()
+    for i in range(25):
+        decoder.put('invalid message %d' % i)
+    with gevent.Timeout(5):
+        while decoder.invalid_count < 25:
+            gevent.sleep(0.01)
+    assert decoded == []
+    assert decoder.decoded_count == 0
+    decoder.kill()
+    pool.close()
+
+
+def test_decoder_pool_dead_worker():
+    """a dead worker fails its batch only and is replaced"""
+    pool = DecoderPool(1)
+    process = pool.processes[0][0]
+    process.terminate()
+    process.join(5)
+    with pytest.raises((EOFError, OSError)):
+        pool.decode(['invalid message'])
+    assert len(pool.processes) == 1
+    assert pool.processes[0][0] is not process
+    assert pool.decode(['invalid message']) == ['json']
+
+    decoder = BatchDecoder(pool, None)
+    pool.processes[0][0].terminate()
+    decoder.decode_batch(['a', 'b'])
+    assert decoder.invalid_count == 2
+    decoder.decode_batch(['c'])
+    assert decoder.invalid_count == 3
+    pool.close()
+
+
+def test_decode_messages_on_hub(monkeypatch):
+    """other greenlets keep running while a large batch is decoded on the hub"""
+    ticks = []
+
+    def tick():
+        while True:
+            ticks.append(len(decoded))
+            gevent.sleep(0)
+
+    decoded = []
+
+    def deserialize(json_msg):
+        decoded.append(json_msg)
+        return json_msg
+
+    monkeypatch.setattr(Message, 'deserialize', staticmethod(deserialize))
+    ticker = gevent.spawn(tick)
+    gevent.sleep(0)
+    batch = ['{"message_type": "BalanceProof", "n": %d}' % i for i in range(1000)]
+    result = decode_messages_on_hub(batch, ['BalanceProof'], chunk_size=100)
+    ticker.kill()
+    assert [x['n'] for x in result] == list(range(1000))
+    # the other greenlet ran between the chunks
+    assert [x for x in ticks if 0 < x < 1000] == list(range(100, 1000, 100))
+
+
+def test_decode_type_filter(monkeypatch):
+    """messages of other types are dropped before deserialization"""
+    deserialized = []
+    monkeypatch.setattr(Message, 'deserialize', staticmethod(deserialized.append))
+    decode_message('{"message_type": "FeeInfo"}', ['BalanceProof'])
+    assert deserialized == []
+    decode_message('{"message_type": "BalanceProof"}', ['BalanceProof'])
+    assert len(deserialized) == 1
+
+
+def test_decode_big_integers(monkeypatch):
+    """uint256 fields are parsed exactly, not as floats"""
+    monkeypatch.setattr(Message, 'deserialize', staticmethod(lambda x: x))
+    data = '{"message_type": "BalanceProof", "transferred_amount": %d, "nonce": %d}' % (
+        2**255,
+        2**64 - 1
+    )
+    message = decode_message(data)
+    assert message['transferred_amount'] == 2**255
+    assert isinstance(message['transferred_amount'], int)
+    assert message['nonce'] == 2**64 - 1
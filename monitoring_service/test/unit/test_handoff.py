@@ -0,0 +1,46 @@
+import gevent
+from gevent.monkey import get_original
+from monitoring_service.transport.handoff import HandoffQueue, HANDOFF_ITEMS
+
+start_new_thread = get_original('_thread', 'start_new_thread')
+
+
+def test_handoff_from_thread():
+    """items put by a native thread are processed on the hub, in order"""
+    received = []
+    queue = HandoffQueue(received.append, maxsize=10, name='test_thread')
+    queue.start()
+    start_new_thread(lambda: [queue.put(i) for i in range(100)], ())
+    with gevent.Timeout(5):
+        while len(received) < 100:
+            gevent.sleep(0.01)
+    assert received == list(range(100))
+    assert queue.dropped_count == 0
+    queue.close()
+
+
+def test_handoff_overflow():
+    for overflow, expected in (('drop_newest', [0, 1]), ('drop_oldest', [2, 3])):
+        received = []
+        queue = HandoffQueue(received.append, maxsize=2, overflow=overflow, name=overflow)
+        results = [queue.put(i) for i in range(4)]
+        assert results.count(False) == (2 if overflow == 'drop_newest' else 0)
+        queue.start()
+        gevent.sleep(0.01)
+        assert received == expected
+        assert queue.dropped_count == 2
+        assert HANDOFF_ITEMS.get(queue=overflow, outcome='dropped') == 2
+        queue.close()
+
+
+def test_handoff_block_on_hub():
+    """a greenlet putting into a full queue waits for the consumer"""
+    received = []
+    queue = HandoffQueue(received.append, maxsize=2, name='test_block')
+    queue.start()
+    producer = gevent.spawn(lambda: [queue.put(i) for i in range(10)])
+    producer.join(timeout=1)
+    gevent.sleep(0.01)
+    assert producer.successful()
+    assert received == list(range(10))
+    queue.close()
@@ -0,0 +1,101 @@
+import os
+import gevent
+import pytest
+from monitoring_service.transport.local import (
+    LocalTransport,
+    LocalClient,
+    encode_frame,
+    encode_batch,
+    split_frames,
+    parse_address
+)
+
+
+def test_framing():
+    data = encode_frame('a') + encode_batch(['bc', 'd']) + encode_frame(b'efg')
+    # incomplete frames are left in the buffer
+    frames, consumed = split_frames(data[:-1])
+    assert frames == [(False, b'a'), (True, encode_frame('bc') + encode_frame('d'))]
+    frames, consumed = split_frames(data)
+    assert consumed == len(data)
+    assert frames[-1] == (False, b'efg')
+    with pytest.raises(ValueError):
+        split_frames(encode_frame('x' * 10), max_size=5)
+
+
+def test_parse_address():
+    assert parse_address('unix:/tmp/ms.sock') == '/tmp/ms.sock'
+    assert parse_address('localhost:5002') == ('localhost', 5002)
+
+
+def receive_all(address, transport, received, messages, batch_size):
+    client = LocalClient(address, batch_size=batch_size)
+    for message in messages:
+        client.send(message)
+    client.close()
+    with gevent.Timeout(5):
+        while len(received) < len(messages):
+            gevent.sleep(0.01)
+
+
+@pytest.mark.parametrize('batch_size', [1, 7])
+def test_local_transport_unix(tmpdir, batch_size):
+    path = os.path.join(str(tmpdir), 'ms.sock')
+    transport = LocalTransport(path)
+    received = []
+    transport.run_message_callbacks = received.append
+    transport.start()
+    gevent.sleep(0)
+    messages = ['message %d' % i for i in range(50)]
+    receive_all(path, transport, received, messages, batch_size)
+    assert received == messages
+    transport.stop()
+    transport.join(5)
+    assert os.path.exists(path) is False
+
+
+def test_local_transport_tcp():
+    transport = LocalTransport(('127.0.0.1', 0))
+    received = []
+    transport.run_message_callbacks = received.append
+    transport.start_server()
+    receive_all(transport.server_address, transport, received, ['x', 'y'], 2)
+    assert received == ['x', 'y']
+    transport.stop()
+
+
+def test_local_transport_oversized_frame(tmpdir):
+    path = os.path.join(str(tmpdir), 'ms.sock')
+    transport = LocalTransport(path, max_frame_size=4)
+    received = []
+    transport.run_message_callbacks = received.append
+    transport.start_server()
+    client = LocalClient(path)
+    client.send('abcdef')
+    client.send('abc')
+    with gevent.Timeout(5):
+        # the connection is closed after the oversized frame
+        assert client.sock.recv(1) == b''
+    assert received == []
+    transport.stop()
+
+
+def test_local_transport_keeps_other_files(tmpdir):
+    """only sockets are removed, and only the one this listener created"""
+    path = os.path.join(str(tmpdir), 'ms.sock')
+    with open(path, 'w') as f:
+        f.write('data')
+    with pytest.raises(ValueError):
+        LocalTransport(path).start_server()
+    assert os.path.isfile(path)
+    os.unlink(path)
+
+    transport = LocalTransport(path)
+    transport.start_server()
+    # replaced by another listener meanwhile
+    other = LocalTransport(path)
+    other.start_server()
+    transport.stop()
+    assert os.path.exists(path)
+    other.stop()
+    assert os.path.exists(path) is False
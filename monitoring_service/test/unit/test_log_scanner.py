@@ -0,0 +1,46 @@
+import pytest
+from monitoring_service.log_scanner import LogScanner
+from monitoring_service.test.mockups.fake_web3 import FakeEth, FakeWeb3
+
+EVENT_ABI = {
+    'anonymous': False,
+    'inputs': [],
+    'name': 'Ping',
+    'type': 'event'
+}
+
+
+def test_scan_range_grows():
+    """empty, fast ranges double the chunk size up to max_chunk"""
+    eth = FakeEth()
+    scanner = LogScanner(FakeWeb3(eth), [EVENT_ABI], initial_chunk=10, max_chunk=40)
+    events, end = scanner.scan(1, 1000)
+    assert events == []
+    assert end == 10
+    scanner.scan(end + 1, 1000)
+    scanner.scan(31, 1000)
+    assert eth.log_requests == [(1, 10), (11, 30), (31, 70)]
+    assert scanner.chunk_size == 40
+
+
+def test_scan_range_shrinks():
+    """ranges returning too many logs are halved"""
+    eth = FakeEth(logs_per_block=100)
+    scanner = LogScanner(FakeWeb3(eth), [EVENT_ABI], initial_chunk=100, target_logs=1000)
+    scanner.get_logs(1, 1000)
+    assert scanner.chunk_size == 50
+    scanner.get_logs(101, 1000)
+    assert scanner.chunk_size == 25
+
+
+def test_scan_retries_rejected_range():
+    """a range rejected by the node is retried with a smaller one"""
+    eth = FakeEth(max_range=30)
+    scanner = LogScanner(FakeWeb3(eth), [EVENT_ABI], initial_chunk=100)
+    logs, end = scanner.get_logs(1, 1000)
+    assert end == 25
+    assert eth.log_requests == [(1, 100), (1, 50), (1, 25)]
+
+    scanner = LogScanner(FakeWeb3(FakeEth(max_range=0)), [EVENT_ABI], initial_chunk=4)
+    with pytest.raises(ValueError):
+        scanner.get_logs(1, 1000)
@@ -0,0 +1,154 @@
+import pytest
+from monitoring_service.transport.matrix import MatrixTransport, SYNC_TOKEN_KEY
+
+ROOM_ID = '!room:server'
+
+
+def message(n):
+    return {
+        'event_id': '$%d' % n,
+        'type': 'm.room.message',
+        'sender': '@client:server',
+        'content': {'msgtype': 'm.text', 'body': 'message %d' % n}
+    }
+
+
+class FakeApi:
+    """room history of `count` messages; sync token 'tN' points after message N"""
+    def __init__(self, count):
+        self.count = count
+        self.timeline_limit = 3
+        self.pages = 0
+
+    def sync(self, since=None, timeout_ms=None, filter=None):
+        start = 0 if since is None else int(since[1:])
+        first = max(start, self.count - self.timeline_limit)
+        return {
+            'next_batch': 't%d' % self.count,
+            'rooms': {'join': {ROOM_ID: {'timeline': {
+                'events': [message(n) for n in range(first + 1, self.count + 1)],
+                'limited': first > start,
+                'prev_batch': 't%d' % first
+            }}}}
+        }
+
+    def get_room_messages(self, room_id, token, direction, limit=10, to=None):
+        assert direction == 'b'
+        self.pages += 1
+        end = int(token[1:])
+        stop = 0 if to is None else int(to[1:])
+        start = max(stop, end - limit)
+        return {
+            'chunk': [message(n) for n in range(end, start, -1)],
+            'end': 't%d' % start
+        }
+
+
+class FakeClient:
+    def __init__(self, api):
+        self.api = api
+        self.sync_token = None
+
+
+class FakeRoom:
+    room_id = ROOM_ID
+
+    def __init__(self):
+        self.listeners = []
+
+
+class StateDB:
+    def __init__(self):
+        self.state = {}
+
+    def get_transport_state(self, key, default=None):
+        return self.state.get(key, default)
+
+    def set_transport_state(self, key, value):
+        self.state[key] = value
+
+
+def make_transport(api, state_db):
+    transport = MatrixTransport('server', 'user', 'password', '#room', state_db, page_size=2)
+    transport.client = FakeClient(api)
+    transport.room = FakeRoom()
+    transport.room.listeners.append({
+        'event_type': None,
+        'callback': lambda room, event: transport.dispatch(
+            room,
+            event,
+            transport.client.sync_token
+        )
+    })
+    received = []
+    transport.run_message_callbacks = received.append
+    return transport, received
+
+
+def test_sync_history_resume():
+    """a restarted transport delivers every message sent since the stored token"""
+    state_db = StateDB()
+    api = FakeApi(4)
+    transport, received = make_transport(api, state_db)
+    transport.sync_history()
+    # no stored token: only the last page of the room
+    assert received == ['message 2', 'message 3', 'message 4']
+    assert state_db.state[SYNC_TOKEN_KEY] == 't4'
+    assert transport.client.sync_token == 't4'
+
+    api.count = 11
+    transport, received = make_transport(api, state_db)
+    transport.sync_history()
+    assert received == ['message %d' % n for n in range(5, 12)]
+    assert api.pages == 2
+    assert state_db.state[SYNC_TOKEN_KEY] == 't11'
+
+
+def test_sync_token_saved_after_batch():
+    """the token of a listener batch is stored once the next batch starts"""
+    state_db = StateDB()
+    transport, received = make_transport(FakeApi(0), state_db)
+    transport.sync_history()
+    transport.client.sync_token = 't2'
+    transport.push_event(message(1))
+    transport.push_event(message(2))
+    assert state_db.state[SYNC_TOKEN_KEY] == 't0'
+    transport.client.sync_token = 't3'
+    transport.push_event(message(3))
+    assert state_db.state[SYNC_TOKEN_KEY] == 't2'
+
+
+def test_overflow_policy():
+    """events dropped by the hand-off queue would be skipped by a stored sync token"""
+    with pytest.raises(AssertionError):
+        MatrixTransport('server', 'user', 'password', '#room', StateDB(), overflow='drop_oldest')
+    MatrixTransport('server', 'user', 'password', '#room', overflow='drop_oldest')
+
+
+def test_dedup():
+    """events delivered twice are dropped, also after a restart"""
+    state_db = StateDB()
+    transport, received = make_transport(FakeApi(0), state_db)
+    transport.sync_history()
+    transport.push_event(message(1))
+    transport.push_event(message(1))
+    assert received == ['message 1']
+    assert transport.duplicate_count == 1
+    transport.save_sync_token('t1')
+
+    transport, received = make_transport(FakeApi(0), state_db)
+    transport.push_event(message(1))
+    transport.push_event(message(2))
+    assert received == ['message 2']
+
+
+def test_missed_events_stop_at_seen():
+    """backwards paging stops at an event that was delivered already"""
+    state_db = StateDB()
+    api = FakeApi(20)
+    transport, received = make_transport(api, state_db)
+    transport.push_event(message(15))
+    received.clear()
+    events = transport.get_missed_events('t20', 't0')
+    assert [x['event_id'] for x in events] == ['$16', '$17', '$18', '$19', '$20']
+    assert api.pages == 3
@@ -0,0 +1,37 @@
+from monitoring_service.metrics import Registry, Counter, Gauge, Histogram
+
+
+def test_exposition():
+    registry = Registry()
+    counter = Counter('test_total', 'Test counter', ['reason'], registry=registry)
+    counter.inc(reason='a "quoted"\nvalue')
+    Counter('test_unlabelled_total', 'Never incremented', registry=registry)
+    gauge = Gauge('test_depth', 'Test gauge', ['queue'], registry=registry)
+    depth = [3]
+    gauge.set_function(lambda: depth[0], queue='q')
+    histogram = Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1.0),
+                          registry=registry)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    depth[0] = 4
+    assert registry.exposition().split('\n') == [
+        '# HELP test_depth Test gauge',
+        '# TYPE test_depth gauge',
+        'test_depth{queue="q"} 4',
+        '# HELP test_seconds Test histogram',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1.0"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        'test_seconds_sum 5.55',
+        'test_seconds_count 3',
+        '# HELP test_total Test counter',
+        '# TYPE test_total counter',
+        'test_total{reason="a \\"quoted\\"\\nvalue"} 1',
+        '# HELP test_unlabelled_total Never incremented',
+        '# TYPE test_unlabelled_total counter',
+        'test_unlabelled_total 0',
+        ''
+    ]
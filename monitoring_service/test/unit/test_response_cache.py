@@ -0,0 +1,39 @@
+import json
+from monitoring_service.api.response_cache import ResponseCache
+
+
+class StateDB:
+    def __init__(self):
+        self.balance_proofs = {}
+        self.change_listeners = []
+
+    def add_change_listener(self, callback):
+        self.change_listeners.append(callback)
+
+    def store(self, channel_id, nonce):
+        self.balance_proofs[channel_id] = {'channel_id': channel_id, 'nonce': nonce}
+        [x(channel_id) for x in self.change_listeners]
+
+    def get_balance_proof(self, channel_id):
+        return self.balance_proofs.get(channel_id, None)
+
+    def query_balance_proofs(self):
+        return [self.balance_proofs[x] for x in sorted(self.balance_proofs)]
+
+
+def test_response_cache():
+    state_db = StateDB()
+    cache = ResponseCache(state_db)
+    state_db.store(2, 1)
+    state_db.store(1, 1)
+    full_list = cache.get_full_list()
+    assert json.loads(full_list.decode()) == state_db.query_balance_proofs()
+    assert cache.get_full_list() is full_list
+    assert cache.get_entry(3) is None
+    assert json.loads(cache.get_count().decode()) == {'count': 2}
+
+    # only the changed entry is encoded again
+    state_db.store(2, 2)
+    assert json.loads(cache.get_full_list().decode())[1]['nonce'] == 2
+    assert cache.misses == 3
+    assert cache.hits == 1
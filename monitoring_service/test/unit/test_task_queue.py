@@ -0,0 +1,64 @@
+import gevent
+import gevent.queue
+import pytest
+from monitoring_service.tasks import TaskQueue
+from monitoring_service.tasks.task_queue import TASK_QUEUE_DEPTH
+
+
+class Task(gevent.Greenlet):
+    running = 0
+    max_running = 0
+
+    def __init__(self, result, delay=0.01):
+        super().__init__()
+        self.result = result
+        self.delay = delay
+
+    def _run(self):
+        Task.running += 1
+        Task.max_running = max(Task.max_running, Task.running)
+        gevent.sleep(self.delay)
+        Task.running -= 1
+        if self.result is None:
+            raise ValueError('task failed')
+        return self.result
+
+
+def test_task_queue():
+    """tasks run in a bounded number of workers and outcomes are counted"""
+    tasks = TaskQueue(workers=3, maxsize=100)
+    tasks.start()
+    for i in range(20):
+        tasks.put(Task(i % 4 != 0))
+    assert tasks.queue_depth > 0
+    assert tasks.join(timeout=5)
+    assert Task.max_running == 3
+    assert tasks.stats() == {'queue_depth': 0, 'succeeded': 15, 'rejected': 5, 'failed': 0}
+    tasks.stop()
+
+
+def test_task_queue_backpressure():
+    """put blocks while the queue is full"""
+    tasks = TaskQueue(workers=1, maxsize=2)
+    [tasks.put(Task(True)) for _ in range(2)]
+    with pytest.raises(gevent.queue.Full):
+        tasks.put(Task(True), timeout=0.01)
+    tasks.start()
+    tasks.put(Task(True), timeout=1)
+    assert tasks.join(timeout=1)
+    assert tasks.succeeded_count == 3
+    tasks.stop()
+
+
+def test_task_queue_depth_gauge():
+    """only running queues are exposed, a stopped one does not remove its successor"""
+    old = TaskQueue(name='gauge_test')
+    old.start()
+    old.put(Task(True))
+    assert TASK_QUEUE_DEPTH.get(queue='gauge_test') == 1
+    new = TaskQueue(name='gauge_test')
+    new.start()
+    old.stop()
+    assert TASK_QUEUE_DEPTH.get(queue='gauge_test') == 0
+    new.stop()
+    assert ('gauge_test',) not in TASK_QUEUE_DEPTH.functions
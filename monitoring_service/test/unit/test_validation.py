@@ -0,0 +1,56 @@
+import pytest
+from monitoring_service.metrics import Registry, Counter, Histogram
+from monitoring_service.tasks.validation import (
+    ValidationPipeline,
+    VALIDATION_CHECKS,
+    VALIDATION_CHECK_SECONDS,
+    COST_LOCAL,
+    COST_STATE,
+    COST_RPC
+)
+
+
+def test_validation_pipeline():
+    """checks run cheapest first and stop at the first rejection"""
+    calls = []
+
+    def check(name, result):
+        def f(value):
+            calls.append(name)
+            return result(value)
+        return f
+
+    pipeline = ValidationPipeline('test')
+    pipeline.register('rpc', COST_RPC, check('rpc', lambda x: True))
+    pipeline.register('positive', COST_LOCAL, check('positive', lambda x: x > 0))
+    pipeline.register('even', COST_STATE, check('even', lambda x: x % 2 == 0))
+    assert pipeline.names == ['positive', 'even', 'rpc']
+
+    assert pipeline.run(2) is None
+    assert calls == ['positive', 'even', 'rpc']
+    calls.clear()
+    assert pipeline.run(-2) == 'positive'
+    assert calls == ['positive']
+
+    assert VALIDATION_CHECKS.get(pipeline='test', check='positive', result='passed') == 1
+    assert VALIDATION_CHECKS.get(pipeline='test', check='positive', result='rejected') == 1
+    assert VALIDATION_CHECKS.get(pipeline='test', check='rpc', result='passed') == 1
+    assert VALIDATION_CHECK_SECONDS.get(pipeline='test', check='positive').count == 2
+    assert VALIDATION_CHECK_SECONDS.get(pipeline='test', check='rpc').count == 1
+
+
+def test_metrics():
+    registry = Registry()
+    counter = Counter('requests_total', 'requests', ['method'], registry=registry)
+    counter.inc(method='GET')
+    counter.inc(2, method='GET')
+    assert counter.get(method='GET') == 3
+    assert counter.get(method='POST') == 0
+    with pytest.raises(AssertionError):
+        counter.inc(path='/')
+
+    histogram = Histogram('latency_seconds', 'latency', buckets=(0.1, 1), registry=registry)
+    [histogram.observe(x) for x in (0.05, 0.1, 0.5, 5)]
+    assert histogram.get().buckets == [2, 1, 1]
+    assert histogram.get().count == 4
+    assert registry.get('latency_seconds') is histogram
@@ -0,0 +1,82 @@
+"""Measure how many signed messages per second the transport can decode.
+
+Signed balance proofs are generated once and then decoded on the hub
+(`--workers 0`) and in `DecoderPool`s of the given sizes.
+"""
+from gevent import monkey
+monkey.patch_all()
+import time # noqa
+import random # noqa
+import click # noqa
+import gevent # noqa
+from eth_utils import to_checksum_address # noqa
+from raiden_libs.messages import BalanceProof # noqa
+
+from monitoring_service.transport.decoder import ( # noqa
+    DecoderPool,
+    BatchDecoder,
+    decode_message
+)
+
+
+def random_address():
+    return to_checksum_address('0x%040x' % random.getrandbits(160))
+
+
+def signed_messages(count: int) -> list:
+    privkey = '0x%064x' % random.getrandbits(256)
+    contract_address = random_address()
+    participant = random_address()
+    return [
+        BalanceProof(
+            channel_id=i + 1,
+            contract_address=contract_address,
+            participant1=participant,
+            participant2=random_address(),
+            nonce=random.randint(1, 2**32),
+            transferred_amount=random.randint(0, 2**64)
+        ).serialize_full(privkey)
+        for i in range(count)
+    ]
+
+
+def decode_inline(messages: list) -> int:
+    return len([x for x in map(decode_message, messages) if x is not None])
+
+
+def decode_in_pool(messages: list, pool: DecoderPool, batch_size: int) -> int:
+    decoded = []
+    decoder = BatchDecoder(pool, decoded.append, batch_size=batch_size)
+    decoder.start()
+    [decoder.put(x) for x in messages]
+    while decoder.decoded_count + decoder.invalid_count < len(messages):
+        gevent.sleep(0.001)
+    decoder.kill()
+    return len(decoded)
+
+
+@click.command()
+@click.option('--messages', default=5000, help='number of messages to decode')
+@click.option('--batch-size', default=100, help='messages per batch sent to a worker')
+@click.option('--workers', default=[0, 1, 2, 4, 8], multiple=True, help='pool sizes to compare')
+def main(messages, batch_size, workers):
+    click.echo('signing %d balance proofs...' % messages)
+    data = signed_messages(messages)
+    for worker_count in workers:
+        if worker_count == 0:
+            start = time.monotonic()
+            decoded = decode_inline(data)
+            elapsed = time.monotonic() - start
+        else:
+            # do not count process startup
+            pool = DecoderPool(worker_count)
+            start = time.monotonic()
+            decoded = decode_in_pool(data, pool, batch_size)
+            elapsed = time.monotonic() - start
+            pool.close()
+        assert decoded == messages
+        click.echo('workers=%d %.0f msg/s' % (worker_count, messages / elapsed))
+
+
+if __name__ == "__main__":
+    main()
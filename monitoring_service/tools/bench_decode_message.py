@@ -0,0 +1,66 @@
+"""Compare the transport's message decoding with a plain `json.loads` and
+`Message.deserialize`, for valid, invalid and irrelevant messages, to measure what
+the message type pre-filter saves.
+
+Irrelevant messages are other message types and text chatter in the shared room,
+invalid ones are broken JSON and messages not matching the envelope schema.
+"""
+import json
+import time
+import click
+import jsonschema
+from raiden_libs.messages import Message
+from raiden_libs.exceptions import MessageSignatureError, MessageFormatError
+
+from monitoring_service.transport.decoder import decode_message
+from monitoring_service.tools.bench_decode import signed_messages
+
+MESSAGE_TYPES = ['BalanceProof']
+
+
+def plain_decode(data: str):
+    try:
+        return Message.deserialize(json.loads(data))
+    except (
+        json.decoder.JSONDecodeError,
+        jsonschema.exceptions.ValidationError,
+        MessageSignatureError,
+        MessageFormatError
+    ):
+        return None
+
+
+def corpora(count: int) -> dict:
+    valid = signed_messages(count)
+    half = count // 2
+    invalid = ['{"message_type": "BalanceProof", "nonce": %d' % i for i in range(half)]
+    invalid += ['{"message_type": %d}' % i for i in range(count - half)]
+    irrelevant = [x.replace('BalanceProof', 'FeeInfo') for x in valid[:half]]
+    irrelevant += ['hello %d' % i for i in range(count - half)]
+    return {
+        'valid': valid,
+        'invalid': invalid,
+        'irrelevant': irrelevant
+    }
+
+
+def measure(decode, messages: list) -> float:
+    start = time.monotonic()
+    for data in messages:
+        decode(data)
+    return len(messages) / (time.monotonic() - start)
+
+
+@click.command()
+@click.option('--messages', default=2000, help='messages per corpus')
+def main(messages):
+    click.echo('generating messages...')
+    for name, corpus in corpora(messages).items():
+        plain = measure(plain_decode, corpus)
+        fast = measure(lambda x: decode_message(x, MESSAGE_TYPES), corpus)
+        click.echo('%-10s plain=%8.0f msg/s  transport=%8.0f msg/s  (x%.1f)' %
+                   (name, plain, fast, fast / plain))
+
+
+if __name__ == "__main__":
+    main()
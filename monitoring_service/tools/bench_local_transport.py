@@ -0,0 +1,72 @@
+"""Measure end-to-end ingestion throughput of the local transport.
+
+A sender process writes signed balance proofs to a `LocalTransport` in batches of
+each given size; the throughput is the rate at which they reach the message
+callbacks. With `--raw` the messages are only counted, measuring the transport
+alone, otherwise they are decoded as well (`--decode-workers` processes).
+"""
+from gevent import monkey
+monkey.patch_all()
+import os # noqa
+import time # noqa
+import tempfile # noqa
+import multiprocessing # noqa
+import click # noqa
+import gevent # noqa
+
+from monitoring_service.transport import LocalTransport, LocalClient, DecoderPool # noqa
+from monitoring_service.transport.local import parse_address # noqa
+from monitoring_service.tools.bench_decode import signed_messages # noqa
+
+
+def send_messages(address, messages: list, batch_size: int):
+    client = LocalClient(address, batch_size=batch_size)
+    for message in messages:
+        client.send(message)
+    client.close()
+
+
+def run_benchmark(transport, data: list, batch_size: int, raw: bool) -> float:
+    received = []
+    if raw:
+        transport.run_message_callbacks = received.append
+    else:
+        transport.message_callbacks = [received.append]
+    sender = multiprocessing.Process(
+        target=send_messages,
+        args=(transport.address, data, batch_size)
+    )
+    start = time.monotonic()
+    sender.start()
+    while len(received) < len(data):
+        gevent.sleep(0.001)
+    elapsed = time.monotonic() - start
+    sender.join()
+    return elapsed
+
+
+@click.command()
+@click.option('--messages', default=20000, help='number of messages to send')
+@click.option('--batch-size', default=[1, 10, 100], multiple=True, help='messages per frame')
+@click.option('--address', default=None, help='unix:PATH or HOST:PORT (default: temporary socket)')
+@click.option('--raw', is_flag=True, help='do not decode the messages')
+@click.option('--decode-workers', default=0, help='decode in this many processes')
+def main(messages, batch_size, address, raw, decode_workers):
+    click.echo('signing %d balance proofs...' % messages)
+    data = signed_messages(messages)
+    if address is None:
+        address = 'unix:' + os.path.join(tempfile.mkdtemp(), 'bench.sock')
+    transport = LocalTransport(parse_address(address))
+    if decode_workers > 0:
+        transport.use_decoder_pool(DecoderPool(decode_workers))
+    transport.start_server()
+    # listening on port 0 picks a free port
+    transport.address = transport.server_address
+    for size in batch_size:
+        elapsed = run_benchmark(transport, data, size, raw)
+        click.echo('batch_size=%d %.0f msg/s' % (size, messages / elapsed))
+    transport.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measure how long the gevent hub is blocked while StateDB loads a large table.
+
+A ticker greenlet sleeps for `--tick` seconds in a loop and records how late it
+wakes up. With `--read-threads 0` the table scan runs on the hub and the ticker
+stalls for the whole load; with a read pool it keeps ticking.
+"""
+import os
+import time
+import random
+import shutil
+import tempfile
+import click
+import gevent
+from eth_utils import to_checksum_address
+
+from monitoring_service.state_db import StateDB
+from monitoring_service.state_db.encoding import encode_balance_proof
+from monitoring_service.state_db.queries import ADD_BALANCE_PROOF_SQL
+
+
+def random_address():
+    return to_checksum_address('0x%040x' % random.getrandbits(160))
+
+
+def random_balance_proof(channel_id: int) -> dict:
+    return {
+        'channel_id': channel_id,
+        'contract_address': random_address(),
+        'participant1': random_address(),
+        'participant2': random_address(),
+        'nonce': random.randint(1, 2**32),
+        'transferred_amount': random.randint(0, 2**64),
+        'extra_hash': '0x%064x' % random.getrandbits(256),
+        'signature': '0x%0130x' % random.getrandbits(520),
+        'timestamp': int(time.time()),
+        'chain_id': 1
+    }
+
+
+def populate(filename: str, count: int):
+    db = StateDB(filename, synchronous='OFF')
+    db.setup_db(1, random_address(), random_address())
+    db.conn.execute('BEGIN')
+    for channel_id in range(1, count + 1):
+        bp = random_balance_proof(channel_id)
+        db.conn.execute(ADD_BALANCE_PROOF_SQL, encode_balance_proof(bp))
+    db.conn.execute('COMMIT')
+    db.close()
+
+
+class Ticker(gevent.Greenlet):
+    def __init__(self, tick: float):
+        super().__init__()
+        self.tick = tick
+        self.stalls = []
+
+    def _run(self):
+        while True:
+            start = time.monotonic()
+            gevent.sleep(self.tick)
+            self.stalls.append(time.monotonic() - start - self.tick)
+
+
+def run_load(filename: str, read_threads: int, tick: float):
+    ticker = Ticker(tick)
+    ticker.start()
+    gevent.sleep(tick * 2)
+    start = time.monotonic()
+    db = StateDB(filename, read_threads=read_threads)
+    elapsed = time.monotonic() - start
+    gevent.sleep(tick * 2)
+    ticker.kill()
+    stalls = sorted(ticker.stalls)
+    assert len(db.balance_proofs) > 0
+    db.close()
+    return elapsed, stalls[-1], stalls[int(len(stalls) * 0.99)], len(stalls)
+
+
+@click.command()
+@click.option('--rows', default=200000, help='balance proofs to create')
+@click.option('--tick', default=0.001, help='ticker interval (s)')
+@click.option('--read-threads', default=[0, 4], multiple=True, help='read pool sizes to compare')
+def main(rows, tick, read_threads):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'state.db')
+        click.echo('creating %d balance proofs...' % rows)
+        populate(filename, rows)
+        for threads in read_threads:
+            elapsed, max_stall, p99_stall, ticks = run_load(filename, threads, tick)
+            click.echo(
+                'read_threads=%d load=%.2fs ticks=%d max hub stall=%.1fms p99=%.1fms' %
+                (threads, elapsed, ticks, max_stall * 1000, p99_stall * 1000)
+            )
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
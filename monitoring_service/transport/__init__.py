@@ -1,7 +1,12 @@
 from .transport import Transport
 from .matrix import MatrixTransport
+from .decoder import DecoderPool
+from .local import LocalTransport, LocalClient
 
 __all__ = [
     'Transport',
-    'MatrixTransport'
+    'MatrixTransport',
+    'DecoderPool',
+    'LocalTransport',
+    'LocalClient'
 ]
@@ -0,0 +1,253 @@
+import json
+import logging
+import multiprocessing
+import gevent
+import gevent.pool
+import gevent.queue
+import jsonschema
+from gevent.socket import wait_read
+from raiden_libs.messages import Message
+from raiden_libs.exceptions import MessageSignatureError, MessageFormatError
+from monitoring_service.metrics import Counter
+
+# the standard parser keeps integers exact; faster ones (orjson, ujson) turn uint256
+# amounts into floats or reject them
+json_loads = json.loads
+
+log = logging.getLogger(__name__)
+
+MESSAGES_RECEIVED = Counter(
+    'monitoring_service_messages_received_total',
+    'Raw messages received by the transport'
+)
+MESSAGES_DECODED = Counter(
+    'monitoring_service_messages_decoded_total',
+    'Messages decoded and verified, by type',
+    ['type']
+)
+MESSAGES_REJECTED = Counter(
+    'monitoring_service_messages_rejected_total',
+    'Received messages dropped while decoding, by reason',
+    ['reason']
+)
+
+
+def get_message_type(json_msg):
+    """Type of a parsed message from its envelope (`message_type`), None if it has
+    none. Messages without a type are not filtered out, `Message.deserialize` rejects
+    them"""
+    if not isinstance(json_msg, dict):
+        return None
+    return json_msg.get('message_type', None)
+
+
+def decode_message_or_reason(data, message_types=None):
+    """Parse a received message and recover its signer. `data` may also be a message
+    parsed already, e.g. an item of a JSON array.
+    Returns the `Message`, or why it was rejected: 'json' if it is not valid JSON,
+    'type' if its type is not in `message_types` (if given), 'schema', 'format' or
+    'signature' if it fails schema/signature checks.
+
+    The type is checked before `Message.deserialize`, so messages of other types are
+    dropped before schema validation and the expensive signature recovery."""
+    if isinstance(data, dict):
+        json_msg = data
+    else:
+        try:
+            json_msg = json_loads(data)
+        except (ValueError, TypeError):
+            return 'json'
+    message_type = get_message_type(json_msg)
+    if message_types is not None and message_type is not None and \
+            message_type not in message_types:
+        return 'type'
+    try:
+        return Message.deserialize(json_msg)
+    except jsonschema.exceptions.ValidationError:
+        return 'schema'
+    except MessageSignatureError:
+        return 'signature'
+    except MessageFormatError:
+        return 'format'
+
+
+def decode_message(data, message_types=None):
+    """Like `decode_message_or_reason`, but returns None for rejected messages"""
+    result = decode_message_or_reason(data, message_types)
+    return None if isinstance(result, str) else result
+
+
+def decode_messages(batch: list, message_types=None) -> list:
+    """`decode_message_or_reason` of each message"""
+    return [decode_message_or_reason(data, message_types) for data in batch]
+
+
+def decode_messages_on_hub(batch: list, message_types=None, chunk_size: int = 100) -> list:
+    """`decode_messages` on the gevent hub. Signature recovery does not yield, so
+    other greenlets get to run after every `chunk_size` messages"""
+    result = []
+    for i in range(0, len(batch), chunk_size):
+        if i > 0:
+            gevent.sleep(0)
+        result.extend(decode_messages(batch[i:i + chunk_size], message_types))
+    return result
+
+
+def decoder_process(requests, results):
+    """Worker process loop: decode batches received on `requests` until it is closed"""
+    while True:
+        try:
+            batch, message_types = requests.recv()
+        except EOFError:
+            return
+        try:
+            result = decode_messages(batch, message_types)
+        except Exception as e:
+            result = e
+        results.send(result)
+
+
+class DecoderPool:
+    """Decode messages and recover their signatures in worker processes.
+
+    ECDSA recovery is the most expensive step of receiving a message, and on the
+    gevent hub it can use a single core only. Each of the `workers` processes
+    decodes one batch at a time; `decode` sends a batch to an idle worker and waits
+    for the result without blocking the hub.
+
+    Workers are connected with simplex pipes (plain file descriptors), as the duplex
+    ones are sockets, which gevent makes non-blocking.
+
+    A worker that dies is replaced by a new one; only the batch it was decoding fails.
+
+    Parameters:
+        workers: number of worker processes, one per CPU by default
+    """
+    def __init__(self, workers: int = None) -> None:
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        assert workers > 0
+        self.processes: list = []
+        self.idle = gevent.queue.Queue()
+        for _ in range(workers):
+            self.idle.put(self.start_worker())
+
+    def start_worker(self) -> tuple:
+        request_reader, request_writer = multiprocessing.Pipe(duplex=False)
+        result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=decoder_process,
+            args=(request_reader, result_writer)
+        )
+        process.daemon = True
+        process.start()
+        request_reader.close()
+        result_writer.close()
+        worker = (process, request_writer, result_reader)
+        self.processes.append(worker)
+        return worker
+
+    @staticmethod
+    def stop_worker(worker: tuple) -> None:
+        process, requests, results = worker
+        requests.close()
+        results.close()
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+
+    def replace_worker(self, worker: tuple) -> tuple:
+        self.processes.remove(worker)
+        self.stop_worker(worker)
+        return self.start_worker()
+
+    def decode(self, batch: list, message_types=None) -> list:
+        """Decode raw messages. Returns a list of `Message`s, or for invalid ones the
+        reason they were rejected, see `decode_message_or_reason`.
+        Raises the error if the batch could not be decoded"""
+        worker = self.idle.get()
+        process, requests, results = worker
+        try:
+            requests.send((batch, message_types))
+            wait_read(results.fileno())
+            result = results.recv()
+        except (EOFError, OSError):
+            log.error('decoder worker %d died (exit code %s), restarting it',
+                      process.pid, process.exitcode)
+            worker = self.replace_worker(worker)
+            raise
+        finally:
+            self.idle.put(worker)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self) -> None:
+        [self.stop_worker(x) for x in self.processes]
+        self.processes = []
+
+
+class BatchDecoder(gevent.Greenlet):
+    """Collect received raw messages into batches and decode them in a `DecoderPool`.
+
+    A batch is sent when `batch_size` messages are queued or `max_latency` seconds
+    after its first message. Batches are decoded concurrently, one per worker, so
+    messages from different batches may be delivered out of order.
+
+    Parameters:
+        pool: `DecoderPool` to decode in
+        callback: called on the hub with every valid decoded message
+        message_types: if set, messages of other types are dropped
+    """
+    def __init__(
+        self,
+        pool: DecoderPool,
+        callback,
+        batch_size: int = 100,
+        max_latency: float = 0.01,
+        message_types=None
+    ) -> None:
+        super().__init__()
+        assert batch_size > 0
+        self.message_types = message_types
+        self.pool = pool
+        self.callback = callback
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = gevent.queue.Queue()
+        self.decoders = gevent.pool.Pool(len(pool.processes))
+        self.decoded_count = 0
+        self.invalid_count = 0
+
+    def put(self, data: str) -> None:
+        self.queue.put(data)
+
+    def next_batch(self) -> list:
+        batch = [self.queue.get()]
+        with gevent.Timeout(self.max_latency, False):
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get())
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self.next_batch()
+            # wait for an idle worker, so the next batch keeps filling up meanwhile
+            self.decoders.wait_available()
+            self.decoders.spawn(self.decode_batch, batch)
+
+    def decode_batch(self, batch: list):
+        try:
+            messages = self.pool.decode(batch, self.message_types)
+        except Exception as e:
+            log.error('dropping a batch of %d messages: %r', len(batch), e)
+            MESSAGES_REJECTED.inc(len(batch), reason='error')
+            self.invalid_count += len(batch)
+            return
+        for message in messages:
+            if isinstance(message, str):
+                MESSAGES_REJECTED.inc(reason=message)
+                self.invalid_count += 1
+                continue
+            self.decoded_count += 1
+            self.callback(message)
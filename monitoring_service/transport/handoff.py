@@ -0,0 +1,118 @@
+import logging
+from collections import deque
+import gevent
+import gevent.event
+from gevent.monkey import get_original
+from monitoring_service.metrics import Counter, Gauge
+
+log = logging.getLogger(__name__)
+
+# native primitives, also when the threading module is monkey patched. Condition is
+# not usable, it allocates its waiter locks from the patched module.
+allocate_lock = get_original('_thread', 'allocate_lock')
+get_thread_ident = get_original('_thread', 'get_ident')
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+HANDOFF_DEPTH = Gauge(
+    'monitoring_service_handoff_queue_depth',
+    'Items waiting in a thread hand-off queue',
+    ['queue']
+)
+HANDOFF_ITEMS = Counter(
+    'monitoring_service_handoff_items_total',
+    'Items put into a thread hand-off queue, by outcome',
+    ['queue', 'outcome']
+)
+
+
+class HandoffQueue(gevent.Greenlet):
+    """Bounded queue passing items from other threads to a greenlet on the hub.
+
+    `put` may be called from any thread. The greenlet wakes up through a loop watcher
+    and calls `callback` with each item, so all processing happens on the hub of the
+    thread that created the queue.
+
+    When `maxsize` items are waiting, `overflow` decides what happens to a new one:
+        block: `put` waits for free space, slowing the producer down
+        drop_oldest: the oldest waiting item is discarded
+        drop_newest: the new item is discarded
+    """
+    def __init__(self, callback, maxsize: int = 1000, overflow: str = 'block', name='handoff'):
+        super().__init__()
+        assert maxsize > 0
+        assert overflow in OVERFLOW_POLICIES
+        self.callback = callback
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue_name = name
+        self.items: deque = deque()
+        self.lock = allocate_lock()
+        # released by the consumer, once per item taken, while threads wait for space
+        self.space_lock = allocate_lock()
+        self.space_lock.acquire()
+        self.waiting_threads = 0
+        self.hub_thread = get_thread_ident()
+        self.has_space = gevent.event.Event()
+        self.has_space.set()
+        self.has_items = gevent.event.Event()
+        self.wakeup = gevent.get_hub().loop.async_()
+        self.wakeup.start(self.has_items.set)
+        self.dropped_count = 0
+
+    def put(self, item) -> bool:
+        """Queue `item`, returns False if it was dropped"""
+        on_hub = get_thread_ident() == self.hub_thread
+        with self.lock:
+            while len(self.items) >= self.maxsize:
+                if self.overflow == 'drop_newest':
+                    self.dropped_count += 1
+                    HANDOFF_ITEMS.inc(queue=self.queue_name, outcome='dropped')
+                    return False
+                if self.overflow == 'drop_oldest':
+                    self.items.popleft()
+                    self.dropped_count += 1
+                    HANDOFF_ITEMS.inc(queue=self.queue_name, outcome='dropped')
+                    break
+                if on_hub:
+                    # waiting on the lock would block the consumer too
+                    self.has_space.clear()
+                    self.lock.release()
+                    try:
+                        self.has_space.wait()
+                    finally:
+                        self.lock.acquire()
+                else:
+                    self.waiting_threads += 1
+                    self.lock.release()
+                    try:
+                        self.space_lock.acquire()
+                    finally:
+                        self.lock.acquire()
+                        self.waiting_threads -= 1
+            self.items.append(item)
+            HANDOFF_ITEMS.inc(queue=self.queue_name, outcome='queued')
+        self.wakeup.send()
+        return True
+
+    def __len__(self):
+        return len(self.items)
+
+    def _run(self):
+        while True:
+            self.has_items.wait()
+            self.has_items.clear()
+            while True:
+                with self.lock:
+                    HANDOFF_DEPTH.set(len(self.items), queue=self.queue_name)
+                    if len(self.items) == 0:
+                        break
+                    item = self.items.popleft()
+                    if self.waiting_threads > 0 and self.space_lock.locked():
+                        self.space_lock.release()
+                self.has_space.set()
+                self.callback(item)
+
+    def close(self):
+        self.kill()
+        self.wakeup.stop()
@@ -0,0 +1,228 @@
+import os
+import stat
+import socket
+import struct
+import logging
+import gevent
+import gevent.event
+import gevent.server
+import gevent.socket
+
+from monitoring_service.transport import Transport
+
+log = logging.getLogger(__name__)
+
+# frame header: payload length, the top bit marks a batch frame
+FRAME_HEADER = struct.Struct('>I')
+BATCH_FLAG = 0x80000000
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+RECV_SIZE = 256 * 1024
+
+
+def parse_address(address: str):
+    """'unix:/path/to/socket' or 'host:port' to a socket address"""
+    if address.startswith('unix:'):
+        return address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    assert host != '', 'address must be unix:PATH or HOST:PORT'
+    return (host, int(port))
+
+
+def encode_frame(message) -> bytes:
+    if isinstance(message, str):
+        message = message.encode()
+    assert len(message) <= MAX_FRAME_SIZE
+    return FRAME_HEADER.pack(len(message)) + message
+
+
+def encode_batch(messages) -> bytes:
+    """One frame carrying `messages`, each of them length-prefixed"""
+    payload = b''.join(encode_frame(x) for x in messages)
+    assert len(payload) <= MAX_FRAME_SIZE
+    return FRAME_HEADER.pack(len(payload) | BATCH_FLAG) + payload
+
+
+def split_frames(buffer, max_size: int = MAX_FRAME_SIZE):
+    """Split complete frames off the start of `buffer`.
+    Returns a list of (is_batch, payload) and the number of bytes consumed"""
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        header, = FRAME_HEADER.unpack_from(buffer, offset)
+        size = header & ~BATCH_FLAG
+        if size > max_size:
+            raise ValueError('frame of %d bytes exceeds the limit of %d' % (size, max_size))
+        end = offset + FRAME_HEADER.size + size
+        if end > len(buffer):
+            break
+        frames.append((header & BATCH_FLAG != 0, bytes(buffer[offset + FRAME_HEADER.size:end])))
+        offset = end
+    return frames, offset
+
+
+def split_batch(payload: bytes) -> list:
+    frames, consumed = split_frames(payload)
+    if consumed != len(payload) or any(is_batch for is_batch, _ in frames):
+        raise ValueError('malformed batch frame')
+    return [x for _, x in frames]
+
+
+def socket_identity(path: str):
+    """Identity of the UNIX socket at `path` (inode and creation time, as inode
+    numbers are reused), None if there is nothing.
+    Raises ValueError if there is something else than a socket"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(st.st_mode):
+        raise ValueError('%s exists and is not a socket' % path)
+    return (st.st_dev, st.st_ino, st.st_ctime_ns)
+
+
+def create_listener(address):
+    if isinstance(address, str):
+        # left over by an earlier run
+        if socket_identity(address) is not None:
+            os.unlink(address)
+        listener = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+        listener.listen(128)
+        return listener
+    return gevent.server.StreamServer.get_listener(address, 128, socket.AF_INET)
+
+
+def connect(address):
+    if isinstance(address, str):
+        sock = gevent.socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+    sock = gevent.socket.create_connection(address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class LocalTransport(Transport):
+    """Receive messages from local processes over a UNIX domain or TCP socket.
+
+    Each message is sent in a frame: a 4 byte big-endian payload length followed by
+    the payload. If the top bit of the length is set, the payload is a batch of
+    length-prefixed messages, which saves a syscall per message for bulk senders.
+    Connections sending a frame larger than `max_frame_size` are closed.
+
+    Sent messages are written to all connected peers.
+
+    Parameters:
+        address: path of a UNIX socket or (host, port) to listen on, see `parse_address`
+    """
+    def __init__(self, address, max_frame_size: int = MAX_FRAME_SIZE) -> None:
+        super().__init__()
+        self.address = address
+        self.max_frame_size = max_frame_size
+        self.is_running = gevent.event.Event()
+        self.server = None
+        # identity of the UNIX socket created by `start_server`
+        self.created_socket = None
+        self.peers: set = set()
+        self.received_count = 0
+        self.invalid_count = 0
+
+    def start_server(self) -> None:
+        """Start listening, before the greenlet runs so clients can connect right away"""
+        if self.server is None:
+            self.server = gevent.server.StreamServer(
+                create_listener(self.address),
+                self.handle_connection
+            )
+            self.server.start()
+            if isinstance(self.address, str):
+                self.created_socket = socket_identity(self.address)
+
+    @property
+    def server_address(self):
+        """Bound address, with the actual port if listening on port 0"""
+        assert self.server is not None
+        return self.server.socket.getsockname()
+
+    def handle_connection(self, sock, address) -> None:
+        self.peers.add(sock)
+        buffer = bytearray()
+        try:
+            while True:
+                data = sock.recv(RECV_SIZE)
+                if not data:
+                    break
+                buffer += data
+                frames, consumed = split_frames(buffer, self.max_frame_size)
+                del buffer[:consumed]
+                for is_batch, payload in frames:
+                    self.receive(split_batch(payload) if is_batch else [payload])
+        except ValueError as e:
+            log.warning('closing local connection from %s: %s', address, e)
+        except OSError as e:
+            log.debug('local connection from %s failed: %s', address, e)
+        finally:
+            self.peers.discard(sock)
+            sock.close()
+
+    def receive(self, messages: list) -> None:
+        for data in messages:
+            self.received_count += 1
+            try:
+                text = data.decode()
+            except UnicodeDecodeError:
+                self.invalid_count += 1
+                continue
+            self.run_message_callbacks(text)
+
+    def transmit_data(self, message):
+        frame = encode_frame(message)
+        for sock in list(self.peers):
+            try:
+                sock.sendall(frame)
+            except OSError as e:
+                log.debug('sending to a local peer failed: %s', e)
+
+    def stop(self) -> None:
+        self.is_running.set()
+        if self.server is not None:
+            self.server.stop()
+        # only our own socket, not one a later listener replaced it with
+        if self.created_socket is not None:
+            try:
+                if socket_identity(self.address) == self.created_socket:
+                    os.unlink(self.address)
+            except ValueError:
+                pass
+            self.created_socket = None
+
+    def _run(self):
+        self.start_server()
+        self.is_running.wait()
+
+
+class LocalClient:
+    """Send messages to a `LocalTransport`.
+    Messages passed to `send` are buffered and written in batch frames of up to
+    `batch_size` messages; call `flush` to send the rest"""
+    def __init__(self, address, batch_size: int = 1) -> None:
+        assert batch_size > 0
+        self.sock = connect(address)
+        self.batch_size = batch_size
+        self.pending: list = []
+
+    def send(self, message) -> None:
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.pending) == 1:
+            self.sock.sendall(encode_frame(self.pending[0]))
+        elif len(self.pending) > 1:
+            self.sock.sendall(encode_batch(self.pending))
+        self.pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self.sock.close()
@@ -2,16 +2,49 @@ import json
 import gevent
 import logging
 import requests
+from collections import deque
 
 from matrix_client.client import MatrixClient
 from matrix_client.errors import MatrixHttpLibError
+from monitoring_service.cache import RecentSet
 from monitoring_service.transport import Transport
+from monitoring_service.transport.handoff import HandoffQueue
 log = logging.getLogger(__name__)
 
+# transport_state key of the sync token to resume from
+SYNC_TOKEN_KEY = 'matrix_next_batch'
+# transport_state key of the ids of the last delivered events
+SEEN_EVENTS_KEY = 'matrix_seen_events'
+
 
 class MatrixTransport(Transport):
-    def __init__(self, homeserver, username, password, matrix_room):
+    """Receive messages from a Matrix room.
+
+    If `state_db` is given, the sync token (`next_batch`) of fully delivered events is
+    stored in it. After a restart or reconnect the transport syncs from that token and
+    pages backwards through the room history, `page_size` events at a time, to deliver
+    everything sent in the meantime. Without a stored token, the last `page_size`
+    events of the room are delivered.
+
+    Events are delivered at most once: ids of the last `dedup_size` events are kept,
+    and an event seen before is dropped before its message is decoded. The last
+    `persist_seen` ids are stored along with the sync token, so duplicates are also
+    caught right after a restart.
+
+    Events received by the matrix client's listener thread are passed to the hub
+    through a `HandoffQueue` of `handoff_size` entries with the `overflow` policy,
+    and processed by its greenlet. Only `block` loses no events: it holds up the
+    listener while the queue is full. The drop policies never hold it up, but the
+    sync token is stored once the events of a sync were dispatched, so dropped events
+    would not be fetched again after a restart. They can only be used without
+    `state_db`.
+    """
+    def __init__(self, homeserver, username, password, matrix_room, state_db=None,
+                 page_size=100, dedup_size=100000, persist_seen=256,
+                 handoff_size=1000, overflow='block'):
         super().__init__()
+        assert state_db is None or overflow == 'block', \
+            'dropped events would be skipped by the stored sync token'
         self.homeserver = homeserver
         self.username = username
         self.password = password
@@ -20,6 +53,21 @@ class MatrixTransport(Transport):
         self.do_reconnect = gevent.event.AsyncResult()
         self.retry_timeout = 5
         self.client = None
+        self.state_db = state_db
+        self.page_size = page_size
+        # sync token of the batch whose events are being delivered
+        self.delivered_token = None
+        self.seen_events = RecentSet(dedup_size)
+        self.last_events: deque = deque(maxlen=persist_seen)
+        self.duplicate_count = 0
+        if state_db is not None:
+            self.load_seen_events()
+        self.handoff = HandoffQueue(
+            lambda item: self.dispatch(*item),
+            maxsize=handoff_size,
+            overflow=overflow,
+            name='matrix'
+        )
 
     def matrix_exception_handler(self, e):
         """Called whenever an exception occurs in matrix client thread.
@@ -38,45 +86,126 @@ class MatrixTransport(Transport):
             self.client.logout()
             self.client = None
         self.client = MatrixClient(self.homeserver)
-        self.client.login_with_password(self.username, self.password)
+        # no initial sync, `sync_history` takes care of it
+        self.client.login_with_password_no_sync(self.username, self.password)
         self.room = self.client.join_room(self.room_name)
+
+    def start_listener(self):
         self.client.start_listener_thread(
             exception_handler=lambda e: self.matrix_exception_handler(e)
         )
 
-    def get_room_events(self, limit=100):
-        f = {"room": {"timeline": {"limit": 100}}}
-        result = self.client.api.sync(filter=json.dumps(f))
-        room_id = self.room.room_id
-        room = result['rooms']['join'][room_id]
-        return room['timeline']['events']
+    def load_sync_token(self):
+        if self.state_db is None:
+            return None
+        return self.state_db.get_transport_state(SYNC_TOKEN_KEY)
+
+    def save_sync_token(self, token):
+        if self.state_db is not None and token is not None:
+            self.state_db.set_transport_state(SYNC_TOKEN_KEY, token)
+            self.state_db.set_transport_state(SEEN_EVENTS_KEY, json.dumps(list(self.last_events)))
+
+    def load_seen_events(self):
+        seen = self.state_db.get_transport_state(SEEN_EVENTS_KEY)
+        if seen is None:
+            return
+        for event_id in json.loads(seen):
+            self.seen_events.add(event_id)
+            self.last_events.append(event_id)
+
+    def is_duplicate(self, event) -> bool:
+        """Record the event as delivered, returns True if it already was"""
+        event_id = event.get('event_id', None)
+        if event_id is None:
+            return False
+        if self.seen_events.add(event_id) is False:
+            self.duplicate_count += 1
+            return True
+        self.last_events.append(event_id)
+        return False
+
+    def get_missed_events(self, from_token, to_token):
+        """Page backwards from `from_token` to `to_token`.
+        Returns the events in chronological order"""
+        events = []
+        while True:
+            page = self.client.api.get_room_messages(
+                self.room.room_id,
+                from_token,
+                'b',
+                limit=self.page_size,
+                to=to_token
+            )
+            chunk = page.get('chunk', [])
+            # stop at the first event that was delivered already
+            seen = [i for i, x in enumerate(chunk) if x.get('event_id', None) in self.seen_events]
+            if len(seen) > 0:
+                events.extend(chunk[:seen[0]])
+                break
+            events.extend(chunk)
+            end = page.get('end', from_token)
+            if len(chunk) == 0 or end in (from_token, to_token):
+                break
+            from_token = end
+        log.info('fetched %d missed events', len(events))
+        return list(reversed(events))
 
     def sync_history(self):
-        events = self.get_room_events()
+        """Deliver events sent since the last stored sync token.
+        The listener thread continues from where this sync ends"""
+        since = self.load_sync_token()
+        f = {"room": {"timeline": {"limit": self.page_size}}}
+        result = self.client.api.sync(since=since, timeout_ms=0, filter=json.dumps(f))
+        room = result['rooms']['join'].get(self.room.room_id, None)
+        events = []
+        if room is not None:
+            timeline = room['timeline']
+            events = timeline['events']
+            # a limited timeline means there were more events than fit in one sync
+            if since is not None and timeline.get('limited', False):
+                events = self.get_missed_events(timeline['prev_batch'], since) + events
+        # already on the hub, no need for the hand-off queue
         for event in events:
-            self.push_event(event)
+            self.dispatch(self.room, event, result['next_batch'])
+        self.save_sync_token(result['next_batch'])
+        self.delivered_token = result['next_batch']
+        self.client.sync_token = result['next_batch']
 
     def push_event(self, event):
         for listener in self.room.listeners:
             if listener['event_type'] is None or listener['event_type'] == event['type']:
                 listener['callback'](self.room, event)
 
-    def dispatch(self, room, event):
+    def receive(self, room, event):
+        """Room listener, may run in the listener thread. The sync token is taken now,
+        as the client may be further ahead by the time the event is dispatched"""
+        self.handoff.put((room, event, self.client.sync_token))
+
+    def dispatch(self, room, event, sync_token):
+        # the client advances its sync token before delivering a batch. Once an event
+        # of a new batch arrives, the previous batch is complete and its token safe to keep
+        if sync_token != self.delivered_token:
+            self.save_sync_token(self.delivered_token)
+            self.delivered_token = sync_token
+        if self.is_duplicate(event):
+            return
         if event['type'] == "m.room.message":
             if event['content']['msgtype'] == "m.text":
                 self.run_message_callbacks(event['content']['body'])
-                log.debug("{0}: {1}".format(event['sender'], event['content']['body']))
+                log.debug('%s: %s', event['sender'], event['content']['body'])
 
     def transmit_data(self, message):
         assert self.room is not None
         self.room.send_text(message)
 
     def _run(self):
+        self.handoff.start()
         while self.is_running.is_set() is False:
             try:
                 self.connect()
-                self.room.add_listener(lambda room, event: self.dispatch(room, event))
+                self.room.add_listener(lambda room, event: self.receive(room, event))
                 self.sync_history()
+                self.start_listener()
                 self.do_reconnect.wait()
                 if self.do_reconnect.get() == 100:
                     gevent.sleep(self.retry_timeout)
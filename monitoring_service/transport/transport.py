@@ -1,8 +1,12 @@
 import gevent
-import json
-import jsonschema
 from raiden_libs.messages import Message
-from raiden_libs.exceptions import MessageSignatureError, MessageFormatError
+from monitoring_service.transport.decoder import (
+    BatchDecoder,
+    decode_message_or_reason,
+    MESSAGES_RECEIVED,
+    MESSAGES_DECODED,
+    MESSAGES_REJECTED
+)
 
 
 class Transport(gevent.Greenlet):
@@ -14,6 +18,8 @@ class Transport(gevent.Greenlet):
         super().__init__()
         self.message_callbacks = list()
         self._private_key = None
+        self.batch_decoder = None
+        self._message_types = None
 
     @property
     def privkey(self):
@@ -27,27 +33,50 @@ class Transport(gevent.Greenlet):
         assert isinstance(private_key, str) or callable(private_key)
         self._private_key = private_key
 
+    @property
+    def message_types(self):
+        return self._message_types
+
+    @message_types.setter
+    def message_types(self, message_types):
+        """Types of messages to deliver, None for all. Others are dropped right after
+        parsing, before validation"""
+        self._message_types = None if message_types is None else frozenset(message_types)
+        if self.batch_decoder is not None:
+            self.batch_decoder.message_types = self._message_types
+
     def add_message_callback(self, callback):
         self.message_callbacks.append(callback)
 
+    def use_decoder_pool(self, pool, batch_size: int = 100, max_latency: float = 0.01):
+        """Decode received messages in batches in a `DecoderPool` instead of on the hub"""
+        assert self.batch_decoder is None
+        self.batch_decoder = BatchDecoder(
+            pool,
+            self.dispatch_message,
+            batch_size=batch_size,
+            max_latency=max_latency,
+            message_types=self.message_types
+        )
+        self.batch_decoder.start()
+
     def run_message_callbacks(self, data):
         """Called whenever a message is received"""
-        # ignore if message is not a JSON
-        try:
-            json_msg = json.loads(data)
-        except json.decoder.JSONDecodeError:
+        MESSAGES_RECEIVED.inc()
+        if self.batch_decoder is not None:
+            self.batch_decoder.put(data)
             return
-        # ignore message if JSON schema validation fails
-        try:
-            deserialized_msg = Message.deserialize(json_msg)
-        except (
-            jsonschema.exceptions.ValidationError,
-            MessageSignatureError,
-            MessageFormatError
-        ):
+        # ignore message if it is not a JSON or if validation fails
+        message = decode_message_or_reason(data, self.message_types)
+        if isinstance(message, str):
+            MESSAGES_REJECTED.inc(reason=message)
             return
+        self.dispatch_message(message)
+
+    def dispatch_message(self, message: Message):
+        MESSAGES_DECODED.inc(type=type(message).__name__)
         for callback in self.message_callbacks:
-            callback(deserialized_msg)
+            callback(message)
 
     def _run(self):
         """Message receiving loop itself